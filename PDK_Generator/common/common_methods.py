@@ -2,6 +2,30 @@ from xml.dom import minidom
 import xml.etree.ElementTree as ET
 import platform
 import os
+import pathlib
+import copy
+from collections import OrderedDict
+import yaml
+try:
+    # libyaml based parser/emitter, much faster than the pure Python ones
+    from yaml import CSafeLoader as YAMLLoader, CSafeDumper as YAMLDumper
+except ImportError:
+    from yaml import SafeLoader as YAMLLoader, SafeDumper as YAMLDumper
+try:
+    # lxml parses XML several times faster and can filter tags in C
+    from lxml import etree
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as etree
+    HAS_LXML = False
+
+# DRC script of each (KLayout folder, technology), shared by all callers
+_DRC_FILE_CACHE = {}
+
+# Parsed YAML files: real path -> (modification time, size, data), least recently used first.
+# The component list and design YAMLs are read several times during one generation.
+_YAML_CACHE = OrderedDict()
+_YAML_CACHE_SIZE = 100
 
 def convert_to_macro(macro_dict):
     """Convert dict to KLayout macro
@@ -99,6 +123,106 @@ def get_klayout_app_path():
     print("Could not find KLayout app...\n")
 
 
+def get_klayout_executable(klayout_app_path):
+    """Get the KLayout executable from a KLayout application path
+    
+    Commands are run without a shell, so the path must point to the bare
+    executable: surrounding quotes and whitespace are removed, only the first
+    path is kept if several were found, and a MacOS application bundle
+    (klayout.app) is resolved to the executable inside it.
+
+    Parameters
+    ----------
+    klayout_app_path : string or None
+        KLayout application path, as returned by get_klayout_app_path
+
+    Returns
+    -------
+    string or None
+        Path of the KLayout executable, None if it does not exist
+
+    """
+    if not klayout_app_path:
+        return None
+    lines = klayout_app_path.strip().splitlines()
+    if not lines:
+        return None
+    executable = lines[0].strip().strip('"')
+    if executable.endswith(".app") and os.path.isdir(executable):
+        executable = os.path.join(executable, "Contents", "MacOS", "klayout")
+    if not os.path.isfile(executable):
+        return None
+    return executable
+
+
+def new_dialog_button_box(button_box_class, buttons):
+    """Create a dialog button box with the given standard buttons
+    
+    Works with the QDialogButtonBox class of PyQt5 and of KLayout's pya
+    bindings, which creates it with new_buttons.
+
+    Parameters
+    ----------
+    button_box_class : type
+        QDialogButtonBox class.
+    buttons : flags
+        Standard buttons, e.g. QDialogButtonBox.Ok | QDialogButtonBox.Cancel.
+
+    Returns
+    -------
+    QDialogButtonBox
+        The dialog button box.
+
+    """
+    if hasattr(button_box_class, 'new_buttons'):
+        return button_box_class.new_buttons(buttons)
+    return button_box_class(buttons)
+
+
+def connect_signal(signal, slot):
+    """Connect a Qt signal to a slot
+    
+    PyQt5 signals are connected with signal.connect(slot), while KLayout's pya
+    signals are called with the slot directly.
+
+    Parameters
+    ----------
+    signal : signal
+        Signal of a Qt widget.
+    slot : callable
+        Function called when the signal is emitted.
+
+    Returns
+    -------
+    None.
+
+    """
+    if hasattr(signal, 'connect'):
+        signal.connect(slot)
+    else:
+        signal(slot)
+
+
+def combo_box_text(combo_box):
+    """Get the text of the selected entry of a combo box
+    
+    currentText is a method in PyQt5 and a property in KLayout's pya bindings.
+
+    Parameters
+    ----------
+    combo_box : QComboBox
+        Drop down menu.
+
+    Returns
+    -------
+    str
+        Text of the selected entry.
+
+    """
+    text = combo_box.currentText
+    return text() if callable(text) else str(text)
+
+
 def get_klayout_folder_path():
     """Get KLayout folder path
     
@@ -128,6 +252,101 @@ def get_klayout_folder_path():
                 return root
     print("Could not find KLayout folde'r...\n")  
     
+def load_yaml_cached(path):
+    """Load a YAML file, reusing the parsed data while the file is unchanged
+    
+    Parameters
+    ----------
+    path : str
+        Path to the YAML file.
+
+    Returns
+    -------
+    data
+        A copy of the parsed YAML data, which the caller is free to modify.
+
+    """
+    key = os.path.realpath(path)
+    st = os.stat(key)
+    cached = _YAML_CACHE.get(key)
+    if cached is not None and cached[0] == st.st_mtime and cached[1] == st.st_size:
+        _YAML_CACHE.move_to_end(key)
+    else:
+        with open(key, 'r') as f:
+            cached = (st.st_mtime, st.st_size, yaml.load(f, Loader=YAMLLoader))
+        _YAML_CACHE[key] = cached
+        while len(_YAML_CACHE) > _YAML_CACHE_SIZE:
+            _YAML_CACHE.popitem(last=False)
+    return copy.deepcopy(cached[2])
+
+def find_drc_file(klayout_folder_path, techname):
+    """Find the DRC script (.lydrc) of a technology
+    
+    Searches the KLayout folder for the technology's DRC script the first
+    time it is needed; later calls are served from a cache.
+
+    Parameters
+    ----------
+    klayout_folder_path : str
+        Absolute path for KLayout folder
+    techname : str
+        Name of technology
+
+    Returns
+    -------
+    str or None
+        Absolute path of the DRC script, None if it could not be found
+
+    """
+    key = (klayout_folder_path, techname)
+    if key not in _DRC_FILE_CACHE:
+        drc_file_path = None
+        if klayout_folder_path:
+            pattern = "*{}_DRC*.lydrc".format(techname)
+            drc_file_path = next((str(path) for path in pathlib.Path(klayout_folder_path).rglob(pattern)), None)
+        _DRC_FILE_CACHE[key] = drc_file_path
+    return _DRC_FILE_CACHE[key]
+
+def count_drc_items(xml_file):
+    """Count the DRC markers (items) of an XML formatted .lyrdb file
+    
+    Parameters
+    ----------
+    xml_file : str
+         Path to XML formatted database file
+
+    Returns
+    -------
+    int
+        Number of DRC items in the file
+
+    """
+    # Stream the file instead of building the whole tree, since a report
+    # can hold millions of markers and only their number is needed
+    count = 0
+    if HAS_LXML:
+        for event, elem in etree.iterparse(xml_file, events=("end",), tag="item"):
+            count += 1
+            # Free the item and the already counted items before it
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        return count
+    
+    parents = []
+    for event, elem in etree.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == "item":
+            count += 1
+            # Detach the finished item so memory use stays constant
+            if parents:
+                parents[-1].remove(elem)
+    
+    return count
+    
 def export_gds(lum_app, filename, top_cell_name, layer_def,
                n_circle = 64, n_ring = 64, n_custom = 64, n_wg = 64,
                round_to_nm = 1, grid = 1e-9, max_objects = 10000):
@@ -1,7 +1,14 @@
 import subprocess
 import platform
 import os
-import xml.etree.ElementTree as ET
+import sys
+
+# Set up path to the common modules. PDK_Generator needs to be in sys.path
+proj_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if proj_path not in sys.path:
+    sys.path.append(proj_path)
+
+from common.common_methods import get_klayout_executable, find_drc_file, count_drc_items
 
 class DRCCheck():
     r"""Design Rule Check (DRC) class used to interface with KLayout's DRC engine
@@ -9,6 +16,20 @@ class DRCCheck():
     Performs technology specific DRC on specified GDS file(s) through KLayout's
     DRC engine. KLayout runs in command line in batch mode.
     
+    The tiling, thread count and deep mode are only passed to the DRC script,
+    as the runtime variables $tiles, $threads and $deep, when they are set.
+    The DRC decks have to read them, e.g. with "tiles($tiles.to_f) if $tiles"
+    and "threads($threads.to_i) if $threads"; they are ignored otherwise.
+    
+    Parameters
+    ----------
+    tiles_um : float, optional
+        Tile size (um) for tiled DRC. The default (None) does not pass a tile size.
+    threads : int, optional
+        Number of DRC threads. The default (None) does not pass a thread count.
+    deep : bool, optional
+        Whether hierarchical (deep) mode should be used. The default is False.
+    
     Attributes
     ----------
     klayout_folder_path : str
@@ -55,10 +76,34 @@ class DRCCheck():
     """
     
     
-    def __init__(self):
+    def __init__(self, tiles_um=None, threads=None, deep=False):
         self.klayout_folder_path = get_klayout_folder_path()
-        self.klayout_app_path = get_klayout_app_path()
+        # Commands are run without a shell, so the path must be the bare executable path
+        self.klayout_app_path = get_klayout_executable(get_klayout_app_path())
         self.drc_file_path = ""
+        self.tiles_um = tiles_um
+        self.threads = threads
+        self.deep = deep
+
+    def find_drc_file(self, techname):
+        """Find the DRC script (.lydrc) of a technology
+        
+        Searches the KLayout folder for the technology's DRC script the first
+        time it is needed; later calls (from any DRCCheck instance) are served
+        from a cache.
+
+        Parameters
+        ----------
+        techname : string
+            Name of technology
+
+        Returns
+        -------
+        string or None
+            Absolute path of the DRC script, None if it could not be found
+
+        """
+        return find_drc_file(self.klayout_folder_path, techname)
 
     def prompt_drc_check(self, num_errors):
         """Prompt user for input on whether to view layout with DRC results
@@ -122,10 +167,7 @@ class DRCCheck():
             Number of DRC Errors detected
 
         """
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        
-        return len(list(root.iter('item')))
+        return count_drc_items(xml_file)
     
     def run_drc(self, techname, gds_filepath, component_name):
         """Run tech specific DRC on given GDS file
@@ -152,32 +194,34 @@ class DRCCheck():
         if not os.path.exists(gds_filepath):
             print("GDS file path {} does not exist... No DRC run...".format(gds_filepath))
             return False
+        if not self.klayout_app_path:
+            print("Could not find KLayout application... No DRC run...")
+            return False
         
         print("Finding {}_DRC.lydrc file...".format(techname))
-        # Get path to DRC file if not available
-        if not self.drc_file_path:
-            for root, dirs, files in os.walk(self.klayout_folder_path):
-                for file in files:
-                    if file.endswith(".lydrc") and "{}_DRC".format(techname) in file:
-                        print("KLAYOUT DRC FILE PATH:")
-                        print(os.path.join(root, file) + "\n")
-                        self.drc_file_path = os.path.join(root, file)
-        else:
+        # Get path to DRC file (searched once per technology)
+        self.drc_file_path = self.find_drc_file(techname)
+        if self.drc_file_path:
             print("KLAYOUT DRC FILE PATH:")
             print(self.drc_file_path + "\n")
         
         if self.drc_file_path:
             # Run DRC and save results
             print("Running KLayout in command line...")
-            print("NOTE: If you copy and paste the following commands into cmd line, ensure quotations are around file paths so that spaces are captured\n")
             print("Running DRC on {}... Saving to {}...".format(os.path.split(gds_filepath)[-1], "{}_drc_results.lyrdb".format(component_name)))
-            command = ["{}".format(self.klayout_app_path), "-b", "-r",
-                       "{}".format(self.drc_file_path), "-rd", 
+            command = [self.klayout_app_path, "-b", "-r",
+                       self.drc_file_path, "-rd",
                        "in_gdsfile={}".format(gds_filepath), "-rd",
                        "out_drc_results={}_drc_results.lyrdb".format(component_name)]
-            for cmd in command:
-                print(cmd, end=" ")
-            subprocess.run(command, shell=True)
+            # Optional settings are left out rather than passed empty, since an empty string is true in Ruby
+            if self.threads:
+                command += ["-rd", "threads={}".format(self.threads)]
+            if self.tiles_um:
+                command += ["-rd", "tiles={}".format(self.tiles_um)]
+            if self.deep:
+                command += ["-rd", "deep=true"]
+            print(subprocess.list2cmdline(command))
+            subprocess.run(command)
             print("\nDRC Complete\n")
             
             drc_results_filepath = os.path.join(os.path.dirname(gds_filepath), "{}_drc_results.lyrdb".format(component_name))
@@ -187,12 +231,11 @@ class DRCCheck():
             if continue_result:
                 # Open GDS file along with DRC results
                 print("Opening GDS and DRC results...")
-                command = ["{}".format(self.klayout_app_path),
-                           "{}".format(gds_filepath), "-m",
-                           "{}".format(os.path.join(os.path.dirname(gds_filepath), "{}_drc_results.lyrdb".format(component_name)))]
-                for cmd in command:
-                    print(cmd, end=" ")
-                subprocess.run(command, shell=True)
+                command = [self.klayout_app_path,
+                           gds_filepath, "-m",
+                           os.path.join(os.path.dirname(gds_filepath), "{}_drc_results.lyrdb".format(component_name))]
+                print(subprocess.list2cmdline(command))
+                subprocess.run(command)
                 print("\nOpened GDS and showing results\n")
             
             # Ask user whether to continue
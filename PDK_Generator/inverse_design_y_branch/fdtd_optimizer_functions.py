@@ -59,10 +59,10 @@ class y_branch_optimization:
         self._parseparse = parse()
         self._df = self._parseparse.extract_YAML(datafile)
         #Component Parsing
-        self._sub_df = self._df.iloc[0]['component']
+        self._sub_df = self._df['component']
         self._sub_df = pd.DataFrame(self._sub_df)
         #Simulation parameters from datafile
-        self._sim_df = self._df.iloc[0]['optimization_variables']
+        self._sim_df = self._df['optimization_variables']
         self._sim_df = pd.DataFrame(self._sim_df)
     
     def extract_x_points(self):
@@ -314,7 +314,7 @@ class recipe:
         """
             parseparse = parse()
             df = parseparse.extract_YAML(datafile)
-            sub_df = df.iloc[0]['component']
+            sub_df = df['component']
             sub_df = pd.DataFrame(sub_df)
             return sub_df
         
@@ -336,9 +336,9 @@ class recipe:
         
         parseparse = parse()
         df = parseparse.extract_YAML(datafile)
-        sub_df = df.iloc[0]['layers_used']
+        sub_df = df['layers_used']
         sub_df = pd.DataFrame(sub_df)
-        _sim_df = df.iloc[0]['optimization_variables']
+        _sim_df = df['optimization_variables']
         _sim_df = pd.DataFrame(_sim_df)
         
         for i in range(len(sub_df)):
@@ -399,7 +399,7 @@ class recipe:
         """
         _parseparse = parse()
         _df = _parseparse.extract_YAML(datafile)
-        _sim_df = _df.iloc[0]['optimization_variables']
+        _sim_df = _df['optimization_variables']
         _sim_df = pd.DataFrame(_sim_df)
         return _sim_df
     
@@ -684,7 +684,7 @@ class retrieve_reqs:
         """
         _parseparse = parse()
         _df = _parseparse.extract_YAML(datafile)
-        _opt_req_df = _df.iloc[0]['optimization_reqs']
+        _opt_req_df = _df['optimization_reqs']
         _opt_req_df = pd.DataFrame(_opt_req_df)
         
         req_arr = []
@@ -47,14 +47,19 @@ def get_fields(fdtd, monitor_name, field_result_name, get_eps, get_D, get_H, noi
                 fields_dict['index']['index_x'] = fields_dict['index']['index_z']*0.0 + 1.0
                 fields_dict['index']['index_y'] = fields_dict['index']['index_x']
         assert 'index_x' in fields_dict['index'] and 'index_y' in fields_dict['index'] and 'index_z' in fields_dict['index']
-        fields_eps = np.stack((np.power(fields_dict['index']['index_x'], 2), 
-                               np.power(fields_dict['index']['index_y'], 2), 
-                               np.power(fields_dict['index']['index_z'], 2)), 
-                               axis = -1)
+        ## Square each (unfolded) index component straight into its slot of the eps array rather than stacking temporaries
+        index_components = (fields_dict['index']['index_x'], fields_dict['index']['index_y'], fields_dict['index']['index_z'])
+        fields_eps = np.empty(np.shape(index_components[0]) + (3,), dtype = np.result_type(*index_components))
+        for component_idx, index_component in enumerate(index_components):
+            np.square(index_component, out = fields_eps[..., component_idx])
     else:
         fields_eps = None
 
-    fields_D = fields_dict['E']['E'] * fields_eps * sp.constants.epsilon_0 if get_D else None
+    if get_D:
+        fields_D = fields_dict['E']['E'] * fields_eps
+        fields_D *= sp.constants.epsilon_0
+    else:
+        fields_D = None
 
     fields_H = fields_dict['H']['H'] if get_H else None
 
@@ -6,19 +6,20 @@ import shutil
 import inspect
 import copy
 import numpy as np
-import matplotlib.pyplot as plt
 import re
-from multiprocessing.dummy import Pool as ThreadPool
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from lumopt.utilities.base_script import BaseScript
 from lumopt.utilities.wavelengths import Wavelengths
 from lumopt.utilities.simulation import Simulation
 from lumopt.utilities.fields import FieldsNoInterp
 from lumopt.utilities.gradients import GradientFields
+from lumopt.utilities.history import OptimizationHistory
 from lumopt.figures_of_merit.modematch import ModeMatch
-from lumopt.utilities.plotter import Plotter
 from lumopt.lumerical_methods.lumerical_scripts import get_fields
 
+_SUFFIX_RE = re.compile(r'_\d+$')
+
 
 class SuperOptimization(object):
     """
@@ -38,10 +39,10 @@ class SuperOptimization(object):
         self.optimizations=optimizations
         self.old_dir = os.getcwd()
         self.full_fom_hist = [] #< Stores the result of every FOM evaluation
-        self.fom_hist = []      #< Only stores the results of every iteration of the optimizer (i.e. not intermediate results from line-searches etc.)
-        self.params_hist=[]     #< List of parameters after iterations
-        self.grad_hist =[]
+        self.history = OptimizationHistory() #< Only stores the results of every iteration of the optimizer (i.e. not intermediate results from line-searches etc.)
         self.continuation_max_iter = 20
+        self._report_fh = None       #< Convergence report, opened on first write and kept open for the rest of the run
+        self._executor = None        #< Thread pool used to schedule CAD operations of the sub-optimizations
 
     def __add__(self,other):
         if self.optimizations is not None:
@@ -52,16 +53,46 @@ class SuperOptimization(object):
             return SuperOptimization([self,other], self.plot_history)
 
     def __del__(self):
+        self.close_convergence_report()
+        self.shutdown_executor()
         os.chdir(self.old_dir)
 
+    def shutdown_executor(self):
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait = True)
+            self._executor = None
+
+    def convergence_report(self):
+        """ Returns the (line buffered) handle of the convergence report in the working directory, opening it if needed. """
+        if self._report_fh is None:
+            self._report_fh = open(os.path.join(self.workingDir,'convergence_report.txt'), 'a', buffering = 1)
+        return self._report_fh
+
+    def close_convergence_report(self):
+        if getattr(self, '_report_fh', None) is not None:
+            self._report_fh.close()
+            self._report_fh = None
+
     def initialize(self, start_params=None, bounds=None, working_dir=None):
 
         print('Initializing super optimization')
         working_dir = 'superopt' if working_dir is None else working_dir
+        self.close_convergence_report()
         self.prepare_working_dir(working_dir)
 
-        ## Generate a super-optimizer by making a deep copy of the first optimizer and then modifying it
-        self.optimizer = copy.deepcopy(self.optimizations[0].optimizer)
+        self.shutdown_executor()
+        self._executor = ThreadPoolExecutor(max_workers = getattr(self, 'num_threads', None) or len(self.optimizations))
+
+        ## Generate a super-optimizer by making a shallow copy of the first optimizer and then modifying it.
+        ## Only the containers that are mutated in place are given fresh instances, everything else is rebound later on.
+        self.optimizer = copy.copy(self.optimizations[0].optimizer)
+        for attr_name in ['current_gradients', 'current_params', 'predictedchange_hist', 'minimizer_kwargs']:
+            if hasattr(self.optimizer, attr_name):
+                setattr(self.optimizer, attr_name, copy.copy(getattr(self.optimizer, attr_name)))
+        self.optimizer.history = copy.deepcopy(self.optimizer.history) #< The history buffers are written in place
+        self.optimizer._log_fh = None #< Do not share the log file handle of the first sub-optimizer
+        self.optimizer.iteration = 0
+        self.history = OptimizationHistory(self.optimizer.max_iter)
         self.optimizer.logging_path = self.workingDir #< Logging from the main optimizer should land in the common paths for super-optimizations
         self.target_fom = sum([o.fom.target_fom for o in self.optimizations]) #< Sum of all target_foms 
 
@@ -78,9 +109,9 @@ class SuperOptimization(object):
             legend_entry = cur_optimization.label if cur_optimization.label else cur_optimization.fom.monitor_name
             self.fom_names.append(legend_entry)
 
+        ## Kept serial: initialize() creates the working directory of each sub-optimization and changes into it (os.chdir is process wide),
+        ## and the legend entries must be appended in the order of the optimizations
         list(map(init_suboptimization, self.optimizations))
-        # with ThreadPool(self.num_threads) as pool:
-        #     pool.map(func = init_suboptimization, iterable = self.optimizations)
 
         if start_params is None:
             start_params = self.optimizations[0].geometry.get_current_params()
@@ -99,10 +130,10 @@ class SuperOptimization(object):
                     adjoint_job_name = optimization.make_adjoint_sim(params, iter)
                     jobs.append(adjoint_job_name)
                 return jobs
-            with ThreadPool(self.num_threads) as pool:
-                nested_job_list = pool.map(func = make_forward_solve, iterable = self.optimizations)
-            for job_list in nested_job_list:
-                for job in job_list:
+            ## Queue the jobs of each sub-optimization as soon as its files are saved rather than waiting for the slowest one
+            futures = [self._executor.submit(make_forward_solve, optimization) for optimization in self.optimizations]
+            for future in as_completed(futures):
+                for job in future.result():
                     self.optimizations[0].sim.fdtd.addjob(job)
             print('Running solves')
             self.optimizations[0].sim.fdtd.runjobs()
@@ -112,7 +143,7 @@ class SuperOptimization(object):
                 iter = self.optimizer.iteration if optimization.store_all_simulations else 0
                 return optimization.process_forward_sim(iter)
 
-            fom_list = list(map(process_forward_solve, self.optimizations))
+            fom_list = list(self._executor.map(process_forward_solve, self.optimizations))
             combined_fom = sum(fom_list)
 
             dist_to_target_fom = self.target_fom - combined_fom  #< For plotting/logging we store the distance to a target
@@ -127,9 +158,7 @@ class SuperOptimization(object):
                 idx, optimization = arg_pair[0], arg_pair[1]
                 jobs = list()
                 iter = opt_iter if optimization.store_all_simulations else 0
-                no_forward_fields = not hasattr(optimization,'forward_fields')
-                params_changed = not np.allclose(params, optimization.geometry.get_current_params())
-                redo_forward_sim = no_forward_fields or params_changed
+                redo_forward_sim = not optimization.forward_fields_are_current(params)
                 do_adjoint_sim = redo_forward_sim or not optimization.optimizer.concurrent_adjoint_solves() or optimization.forward_fields.iter != iter
                 if redo_forward_sim:
                     forward_job_name = optimization.make_forward_sim(params, iter)
@@ -138,10 +167,10 @@ class SuperOptimization(object):
                     adjoint_job_name = optimization.make_adjoint_sim(params, iter)
                     jobs.append(adjoint_job_name)
                 return idx, redo_forward_sim, jobs
-            with ThreadPool(self.num_threads) as pool:
-                nested_job_list = pool.map(func = make_adjoint_solves, iterable = enumerate(self.optimizations))
+            futures = [self._executor.submit(make_adjoint_solves, arg_pair) for arg_pair in enumerate(self.optimizations)]
             redo_forward_sim_dict = dict()
-            for idx,redo_fwd,job_list in nested_job_list:
+            for future in as_completed(futures):
+                idx,redo_fwd,job_list = future.result()
                 redo_forward_sim_dict[idx] = redo_fwd
                 for job in job_list:
                     self.optimizations[0].sim.fdtd.addjob(job)
@@ -158,9 +187,14 @@ class SuperOptimization(object):
                 jac = optimization.calculate_gradients()
                 return np.array(jac)
 
-            with ThreadPool(self.num_threads) as pool:
-                jac_list = pool.map(process_adjoint_solves, enumerate(self.optimizations))
-            self.last_grad = sum(jac_list)
+            ## The gradients are summed in place into a new array rather than with sum(), which allocates
+            ## a temporary per sub-optimization. It is not reused between calls, since the optimizer and
+            ## last_grad keep references to the returned gradient
+            jac_list = self._executor.map(process_adjoint_solves, enumerate(self.optimizations))
+            combined_jac = np.zeros_like(params, dtype = float)
+            for jac in jac_list:
+                combined_jac += jac
+            self.last_grad = combined_jac
 
             #self.full_grad_hist.append(copy.copy(combined_jac))
             return self.last_grad
@@ -169,9 +203,7 @@ class SuperOptimization(object):
             ''' This function is called after each iteration'''
             
             ## Add the last FOM evaluation to the list of FOMs that we wish to plot. This removes entries caused by linesearches etc.
-            self.params_hist.append(params)
-            self.fom_hist.append(self.full_fom_hist[-1])
-            self.grad_hist.append(self.last_grad / self.optimizer.scaling_factor)
+            self.record_history(self.full_fom_hist[-1], params, self.last_grad / self.optimizer.scaling_factor)
 
             for optimization in self.optimizations:
                 optimization.plotting_function(params)
@@ -186,7 +218,7 @@ class SuperOptimization(object):
             self.plotter.set_legend(self.fom_names)
 
             self.plotter.update_gradient(self)
-            self.plotter.draw_and_save()                    #< Finally, refresh the screen and save the image
+            self.plotter.draw_and_save(self.fom_hist[-1])    #< Finally, refresh the screen and save the image
 
             for optimization in self.optimizations:
                 optimization.save_index_to_vtk(self.optimizer.iteration)
@@ -194,15 +226,16 @@ class SuperOptimization(object):
             if hasattr(self.optimizations[0].geometry,'to_file'):
                 self.optimizations[0].geometry.to_file(os.path.join(self.workingDir,'parameters_{}.npz').format(self.optimizer.iteration))
 
-            with open(os.path.join(self.workingDir,'convergence_report.txt'),'a') as f:
-                f.write('{}, {}'.format(self.optimizer.iteration,self.fom_hist[-1]))
-                if hasattr(self.optimizations[0].geometry,'write_status'):
-                    self.optimizations[0].geometry.write_status(f) 
-                if len(self.params_hist[-1])<250:
-                    f.write(', {}'.format(np.array2string(self.params_hist[-1], separator=', ', max_line_width=10000)))
-                if len(self.grad_hist[-1])<250:
-                    f.write(', {}'.format(np.array2string(self.grad_hist[-1], separator=', ', max_line_width=10000)))
-                f.write('\n')
+            f = self.convergence_report()
+            f.write('{}, {}'.format(self.optimizer.iteration,self.fom_hist[-1]))
+            if hasattr(self.optimizations[0].geometry,'write_status'):
+                self.optimizations[0].geometry.write_status(f) 
+            if len(self.params_hist[-1])<250:
+                f.write(', {}'.format(np.array2string(self.params_hist[-1], separator=', ', max_line_width=10000)))
+            if len(self.grad_hist[-1])<250:
+                f.write(', {}'.format(np.array2string(self.grad_hist[-1], separator=', ', max_line_width=10000)))
+            f.write('\n')
+            f.flush()
    
         if hasattr(self.optimizer,'initialize'):
             self.optimizer.initialize(start_params=start_params,
@@ -213,14 +246,32 @@ class SuperOptimization(object):
 
     def init_plotter(self):
         if self.plotter is None:
+            from lumopt.utilities.plotter import Plotter #< Deferred so that matplotlib is only loaded when plotting
             self.plotter = Plotter(movie = True, plot_history = self.plot_history)
 
+    @property
+    def fom_hist(self):
+        return self.history.fom_view()
+
+    @property
+    def params_hist(self):
+        return self.history.params_view()
+
+    @property
+    def grad_hist(self):
+        return self.history.grad_view()
+
+    def record_history(self, fom, params = None, grad = None):
+        """ Appends the results of an optimizer iteration to the history. """
+        self.history.append(fom, params, grad)
+
     def plot_fom(self, fomax, paramsax, gradients_ax):
 
+        fom_hist = self.fom_hist
         if self.plot_fom_on_log_scale:
-            fomax.semilogy(np.abs(self.fom_hist))
+            fomax.semilogy(np.abs(fom_hist))
         else:
-            fomax.plot(np.abs(self.fom_hist))
+            fomax.plot(np.abs(fom_hist))
         
         fomax.set_xlabel('Iteration')
         fomax.set_title('Figure of Merit')
@@ -233,7 +284,7 @@ class SuperOptimization(object):
             paramsax.set_ylabel('Parameters')
             paramsax.set_title("Parameter evolution")
     
-        if (gradients_ax is not None) and hasattr(self, 'grad_hist'):
+        if gradients_ax is not None:
             gradients_ax.clear()
             gradients_ax.semilogy(np.abs(self.grad_hist))
             gradients_ax.set_xlabel('Iteration')
@@ -241,6 +292,7 @@ class SuperOptimization(object):
             gradients_ax.set_title("Gradient evolution")
 
     def plot_gradient(self, fig, ax_fields, ax_gradients):
+        import matplotlib.pyplot as plt
 
         self.optimizations[0].gradient_fields.forward_fields.plot(ax_fields, title = 'Forward Fields', cmap = 'Blues')
 
@@ -248,18 +300,26 @@ class SuperOptimization(object):
         main_grad = self.optimizations[0].gradient_fields
         x = main_grad.forward_fields.x
         y = main_grad.forward_fields.y
-        xx, yy = np.meshgrid(x, y)
         
         combined_gradients = 0
         for optimization in self.optimizations:
             combined_gradients = combined_gradients + optimization.gradient_fields.get_forward_dot_adjoint_center()
 
-        im = ax_gradients.pcolormesh(xx*1e6, yy*1e6, combined_gradients, cmap = plt.get_cmap('bwr'))
+        ## On a uniform grid the gradients can be drawn as a single image, which is much cheaper than a quad mesh
+        if SuperOptimization.is_uniform_grid(x) and SuperOptimization.is_uniform_grid(y):
+            im = ax_gradients.imshow(combined_gradients, extent = (x[0]*1e6, x[-1]*1e6, y[0]*1e6, y[-1]*1e6), origin = 'lower', cmap = plt.get_cmap('bwr'), aspect = 'auto')
+        else:
+            xx, yy = np.meshgrid(x, y)
+            im = ax_gradients.pcolormesh(xx*1e6, yy*1e6, combined_gradients, cmap = plt.get_cmap('bwr'))
         ax_gradients.set_title('Sparse perturbation gradient fields')
         ax_gradients.set_xlabel('x(um)')
         ax_gradients.set_ylabel('y(um)')
 
 
+    @staticmethod
+    def is_uniform_grid(coords):
+        return len(coords) > 1 and np.allclose(np.diff(coords), coords[1] - coords[0])
+
     def prepare_working_dir(self, working_dir):
 
         ## Check if we have an absolute path
@@ -268,15 +328,21 @@ class SuperOptimization(object):
             working_dir = os.path.abspath(os.path.join(self.base_file_path,working_dir))
         
         ## Check if the provided path already ends with _xxxx (where xxxx is a number)
-        result = re.match(r'_\d+$', working_dir)
-        without_suffix = re.sub(r'_\d+$', '', working_dir)
-        suffix_num = int(result[1:]) if result else 0
-        working_dir = without_suffix+'_{}'.format(suffix_num)
-
-        ## Check if path already exists. If so, keep increasing the number until it does not exist
-        while os.path.exists(working_dir):
+        result = _SUFFIX_RE.search(working_dir)
+        without_suffix = _SUFFIX_RE.sub('', working_dir)
+        suffix_num = int(result.group(0)[1:]) if result else 0
+
+        ## Check if path already exists. If so, keep increasing the number until it does not exist.
+        ## The parent directory is listed once instead of probing every candidate with a stat call.
+        parent_dir, base_name = os.path.split(without_suffix)
+        if os.path.isdir(parent_dir):
+            with os.scandir(parent_dir) as entries:
+                existing = {entry.name for entry in entries}
+        else:
+            existing = set()
+        while base_name+'_{}'.format(suffix_num) in existing:
             suffix_num += 1
-            working_dir = without_suffix+'_{}'.format(suffix_num)
+        working_dir = without_suffix+'_{}'.format(suffix_num)
 
         os.makedirs(working_dir)
         os.chdir(working_dir)
@@ -336,6 +402,9 @@ class SuperOptimization(object):
 
                 self.optimizer.run()
                 
+        self.close_convergence_report()
+        self.optimizer.close_log_file()
+        self.shutdown_executor()
         final_fom = np.abs(self.fom_hist[-1])
         return final_fom,self.params_hist[-1]
 
@@ -385,6 +454,9 @@ class Optimization(SuperOptimization):
         self.unfold_symmetry = geometry.unfold_symmetry
         self.label=label
         self.plot_fom_on_log_scale = (float(fom.target_fom) != 0.0)
+        self._last_params = None #< Copy of the parameters used for the last forward solve
+        self._last_fom = None    #< Figure of merit of the last forward solve, returned again when the FOM is requested for the same parameters
+        self._gradient_fields = None #< Built on first access, since only the field-based gradient path and the plots need it
 
         if self.use_deps:
             print("Accurate interface detection enabled")
@@ -412,49 +484,53 @@ class Optimization(SuperOptimization):
                 self.optimizer.reset_start_params(self.params_hist[-1], 0.05) #< Run the scaling analysis again
                 self.optimizer.run()
 
+        self.close_convergence_report()
+        self.optimizer.close_log_file()
         final_fom = np.abs(self.fom_hist[-1])
         return final_fom,self.params_hist[-1]
 
     def plotting_function(self, params):
         ## Add the last FOM evaluation to the list of FOMs that we wish to plot. This removes entries caused by linesearches etc.
-        self.fom_hist.append(self.full_fom_hist[-1])
-
-        ## In a multi-FOM optimization, only the first optimization has a plotter
+        ## In a multi-FOM optimization, only the first optimization has a plotter and keeps track of the parameters and gradients.
         if self.plotter is not None:
+            self.record_history(self.full_fom_hist[-1], params, self.last_grad / self.optimizer.scaling_factor)
+        else:
+            self.record_history(self.full_fom_hist[-1])
 
-            self.params_hist.append(params)
-            self.grad_hist.append(self.last_grad / self.optimizer.scaling_factor)
+        if self.plotter is not None:
 
             self.plotter.clear()
             self.plotter.update_fom(self)
             self.plotter.update_gradient(self)
             self.plotter.update_geometry(self)
-            self.plotter.draw_and_save()
+            self.plotter.draw_and_save(self.fom_hist[-1])
 
             self.save_index_to_vtk(self.optimizer.iteration)
 
             if hasattr(self.geometry,'to_file'):
                 self.geometry.to_file(os.path.join(self.workingDir,'parameters_{}.npz').format(self.optimizer.iteration))
 
-            with open(os.path.join(self.workingDir,'convergence_report.txt'),'a') as f:
-                f.write('{}, {}'.format(self.optimizer.iteration,self.fom_hist[-1]))
+            f = self.convergence_report()
+            f.write('{}, {}'.format(self.optimizer.iteration,self.fom_hist[-1]))
 
-                if hasattr(self.geometry,'write_status'):
-                    self.geometry.write_status(f) 
+            if hasattr(self.geometry,'write_status'):
+                self.geometry.write_status(f) 
 
-                if len(self.params_hist[-1])<250:
-                    f.write(', {}'.format(np.array2string(self.params_hist[-1], separator=', ', max_line_width=10000)))
+            if len(self.params_hist[-1])<250:
+                f.write(', {}'.format(np.array2string(self.params_hist[-1], separator=', ', max_line_width=10000)))
 
-                if len(self.grad_hist[-1])<250:
-                    f.write(', {}'.format(np.array2string(self.grad_hist[-1], separator=', ', max_line_width=10000)))
+            if len(self.grad_hist[-1])<250:
+                f.write(', {}'.format(np.array2string(self.grad_hist[-1], separator=', ', max_line_width=10000)))
 
-                f.write('\n')
+            f.write('\n')
+            f.flush()
 
     def initialize(self, working_dir):
         """ 
             Performs all steps that need to be carried only once at the beginning of the optimization. 
         """
         working_dir = 'opts' if working_dir is None else working_dir
+        self.close_convergence_report()
         self.prepare_working_dir(working_dir)
 
         ## Store a copy of the script file
@@ -502,7 +578,7 @@ class Optimization(SuperOptimization):
 
         self.optimizer.initialize(start_params = start_params, callable_fom = callable_fom, callable_jac = callable_jac, bounds = bounds, plotting_function = plotting_function_fwd)
         
-        self.fom_hist = []
+        self.history = OptimizationHistory(self.optimizer.max_iter)
       
 
     def save_index_to_vtk(self, cur_iteration):
@@ -512,6 +588,7 @@ class Optimization(SuperOptimization):
     def make_forward_sim(self, params, iter):
         self.sim.fdtd.switchtolayout()
         self.geometry.update_geometry(params, self.sim)
+        self._last_params = np.array(params, copy = True)
         self.geometry.add_geo(self.sim, params = None, only_update = True)
         self.sim.fdtd.setnamed('source', 'enabled', True)
         self.fom.make_forward_sim(self.sim)
@@ -533,6 +610,7 @@ class Optimization(SuperOptimization):
         assert hasattr(self.forward_fields, 'E')
         fom = self.fom.get_fom(self.sim)
         self.forward_fields.iter = int(iter)
+        self._last_fom = fom
         if self.store_all_simulations:
             self.sim.remove_data_and_save() #< Remove the data from the file to save disk space. TODO: Make optional?
         
@@ -550,8 +628,12 @@ class Optimization(SuperOptimization):
             :param returns: figure of merit.
         """
 
-        self.sim.fdtd.clearjobs()
         iter = self.optimizer.iteration if self.store_all_simulations else 0
+        ## The FOM is only reused for exactly the same parameters, line searches near convergence take steps far below the tolerance of forward_fields_are_current
+        if self.forward_fields_are_current(params) and np.array_equal(params, self._last_params) and self.forward_fields.iter == iter:
+            print('Reusing forward solve')
+            return self._last_fom
+        self.sim.fdtd.clearjobs()
         print('Making forward solve')
         forward_job_name = self.make_forward_sim(params, iter)
         self.sim.fdtd.addjob(forward_job_name)
@@ -602,9 +684,7 @@ class Optimization(SuperOptimization):
 
         self.sim.fdtd.clearjobs()
         iter = self.optimizer.iteration if self.store_all_simulations else 0
-        no_forward_fields = not hasattr(self,'forward_fields')
-        params_changed = not np.allclose(params, self.geometry.get_current_params())
-        redo_forward_sim = no_forward_fields or params_changed
+        redo_forward_sim = not self.forward_fields_are_current(params)
         do_adjoint_sim = redo_forward_sim or not self.optimizer.concurrent_adjoint_solves() or self.forward_fields.iter != iter 
         if redo_forward_sim:
             print('Making forward solve')
@@ -626,6 +706,16 @@ class Optimization(SuperOptimization):
         self.last_grad = self.calculate_gradients()
         return self.last_grad
 
+    def forward_fields_are_current(self, params):
+        """ Checks if the stored forward fields were computed with the given parameters. The parameters are compared against the
+            copy kept by the last forward solve rather than the geometry parameters, since the geometry may hold a reference to an
+            array that the optimizer has since updated in place.
+        """
+
+        if not hasattr(self, 'forward_fields') or self._last_params is None:
+            return False
+        return np.shape(params) == np.shape(self._last_params) and np.allclose(params, self._last_params)
+
     def calculate_gradients(self):
         """ Calculates the gradient of the figure of merit (FOM) with respect to each of the optimization parameters.
             It assumes that both the forward and adjoint solves have been run so that all the necessary field results
@@ -634,9 +724,11 @@ class Optimization(SuperOptimization):
                 2) using the shape derivative approximation described in Owen Miller's thesis (use_deps == False).
         """
 
-        self.gradient_fields = GradientFields(forward_fields = self.forward_fields, adjoint_fields = self.adjoint_fields)
+        self._gradient_fields = None
         self.sim.fdtd.switchtolayout()
         if self.use_deps:
+            ## The permittivity derivatives are computed in the layout of the simulation loaded by process_adjoint_sim and all
+            ## commands go through the same CAD session, so they cannot be issued any earlier to overlap with the solves.
             if self.custom_deps:
                 self.custom_deps(self.sim,self.geometry)
             else:
@@ -652,6 +744,12 @@ class Optimization(SuperOptimization):
                 fom_partial_derivs_vs_wl = self.geometry.calculate_gradients(self.gradient_fields)
                 self.gradients = self.fom.fom_gradient_wavelength_integral(fom_partial_derivs_vs_wl, self.forward_fields.wl)
         return self.gradients
+
+    @property
+    def gradient_fields(self):
+        if self._gradient_fields is None:
+            self._gradient_fields = GradientFields(forward_fields = self.forward_fields, adjoint_fields = self.adjoint_fields)
+        return self._gradient_fields
     
     def plot_gradient(self, fig, ax1, ax2):
         self.gradient_fields.plot(fig, ax1, ax2)
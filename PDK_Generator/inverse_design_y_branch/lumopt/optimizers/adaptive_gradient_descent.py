@@ -63,17 +63,14 @@ class AdaptiveGradientDescent(Maximizer):
         return res
 
     def calculate_change(self, gradients, dx):
+        gradients = np.asarray(gradients)
         if self.all_params_equal:
-            change = ((np.array(gradients) > 0.0) * 2.0 - 1.0)*dx
-        else:
-            change = np.array(gradients)/np.max(np.abs(np.array(gradients)))*dx
-        return change
+            return np.sign(gradients)*dx
+        return gradients*(dx/np.abs(gradients).max())
 
     def reduce_step_size(self):
         self.dx = np.maximum(self.dx / 2.0, self.min_dx)
         print('Figure of merit decreasing: reducing step size to {}'.format(self.dx))
 
     def enforce_bounds(self,params):
-        bounds_min = np.array([bound[0] for bound in self.bounds])
-        bounds_max = np.array([bound[1] for bound in self.bounds])
-        return np.maximum(bounds_min, (np.minimum(bounds_max, params)))
\ No newline at end of file
+        return np.clip(params, self._bmin, self._bmax, out = params)
\ No newline at end of file
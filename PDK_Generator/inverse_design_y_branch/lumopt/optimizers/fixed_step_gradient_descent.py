@@ -2,7 +2,6 @@
     Copyright (c) 2019 Lumerical Inc. """
 
 import numpy as np
-import numpy.random
 
 from lumopt.optimizers.maximizer import Maximizer
 
@@ -25,26 +24,30 @@ class FixedStepGradientDescent(Maximizer):
         :param noise_magnitude:  amplitude of the noise.
         :param scaling_factor:   scalar or vector of the same length as the optimization parameters; typically used to scale the optimization
                                  parameters so that they have magnitudes in the range zero to one.
+        :param seed:             seed of the random number generator used for the noise; if None, fresh entropy from the operating system is used.
     """
 
-    def __init__(self, max_dx, max_iter, all_params_equal, noise_magnitude, scaling_factor):
+    def __init__(self, max_dx, max_iter, all_params_equal, noise_magnitude, scaling_factor, seed = None):
         super(FixedStepGradientDescent, self).__init__(max_iter, scaling_factor)
         self.max_dx = max_dx * self.scaling_factor
         self.all_params_equal = all_params_equal
         self.noise_magnitude = noise_magnitude * self.scaling_factor
         self.predictedchange_hist = []
+        self._rng = np.random.default_rng(seed)
+        self._noise_buffer = None
 
     def run(self):
-        self.current_params = self.start_point
+        self.current_params = np.array(self.start_point, dtype = float)
         while self.iteration < self.max_iter:
             current_fom = self.callable_fom(self.current_params)
             self.current_fom = current_fom
             gradients = self.callable_jac(self.current_params)
             change = self.calculate_change(gradients, self.max_dx)
+            ## Apply the step and the noise and enforce the bounds in place, without allocating temporaries
             self.current_params += change
-            self.add_noise()
-            self.current_params = self.enforce_bounds(self.current_params)
-            self.predictedchange_hist.append(sum(gradients * change))
+            self.current_params += self.generate_noise()
+            self.enforce_bounds(self.current_params)
+            self.predictedchange_hist.append(float(np.dot(np.asarray(gradients), change)))
             self.callback(self.current_params/self.scaling_factor)
         res = {'fun': self.current_fom, 'jac': gradients*self.scaling_factor, 'x': self.current_params/self.scaling_factor, 'nit':self.iteration}
         print('FINAL FOM = {}'.format(res['fun']))
@@ -52,17 +55,24 @@ class FixedStepGradientDescent(Maximizer):
         return res
 
     def calculate_change(self, gradients, dx):
+        gradients = np.asarray(gradients)
         if self.all_params_equal:
-            change = ((np.array(gradients) > 0.0) * 2.0 - 1.0)*dx
-        else:
-            change = np.array(gradients)/np.max(np.abs(np.array(gradients)))*dx
-        return change
+            return np.sign(gradients)*dx
+        return gradients*(dx/np.abs(gradients).max())
+
+    def generate_noise(self):
+        """ Draws uniform noise in [-noise_magnitude, noise_magnitude] into a buffer that is reused between iterations. """
+        num_params = len(self.current_params)
+        if self._noise_buffer is None or self._noise_buffer.size != num_params:
+            self._noise_buffer = np.empty(num_params)
+        noise = self._rng.random(out = self._noise_buffer)
+        noise *= 2.0
+        noise -= 1.0
+        noise *= self.noise_magnitude
+        return noise
 
     def add_noise(self):
-        noise = self.noise_magnitude*(np.random.rand(len(self.current_params)) - 0.5) * 2.0
-        self.current_params = self.current_params + noise
+        self.current_params += self.generate_noise()
 
     def enforce_bounds(self,params):
-        bounds_min = np.array([bound[0] for bound in self.bounds])
-        bounds_max = np.array([bound[1] for bound in self.bounds])
-        return np.maximum(bounds_min, (np.minimum(bounds_max, params)))
+        return np.clip(params, self._bmin, self._bmax, out = params)
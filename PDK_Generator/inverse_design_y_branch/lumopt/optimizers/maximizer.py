@@ -6,6 +6,8 @@ from lumopt.optimizers.optimizer import Optimizer
 class Maximizer(Optimizer):
     """ Base class (or super class) for all optimizers coded as maximizers. """
 
+    __slots__ = ()
+
     def define_callables(self, callable_fom, callable_jac):
         """ Defines the functions that the Optimizer class will use to evaluate the figure of merit and its gradient. 
 
@@ -17,17 +19,19 @@ class Maximizer(Optimizer):
         """
 
         def callable_fom_local(params):
-            params_over_scaling_factor = params / self.scaling_factor
+            params_over_scaling_factor = params * self._inv_scaling
             fom = callable_fom(params_over_scaling_factor)
-            penalty = self.penalty_fun(params_over_scaling_factor)
-            self.current_fom = fom + penalty
+            if self._has_penalty:
+                fom = fom + self.penalty_fun(params_over_scaling_factor)
+            self.current_fom = fom
             return self.current_fom * self.fom_scaling_factor
 
         def callable_jac_local(params):
-            params_over_scaling_factor = params / self.scaling_factor
-            fom_gradients = callable_jac(params_over_scaling_factor) / self.scaling_factor
-            penalty_gradients = self.penalty_jac(params_over_scaling_factor) / self.scaling_factor
-            self.current_gradients = fom_gradients + penalty_gradients
+            params_over_scaling_factor = params * self._inv_scaling
+            fom_gradients = callable_jac(params_over_scaling_factor) * self._inv_scaling #< New array, so it can be updated in place below
+            if self._has_penalty:
+                fom_gradients += self.penalty_jac(params_over_scaling_factor) * self._inv_scaling
+            self.current_gradients = fom_gradients
             return self.current_gradients * self.fom_scaling_factor
 
         return callable_fom_local, callable_jac_local
\ No newline at end of file
@@ -1,11 +1,15 @@
 """ Copyright chriskeraly
     Copyright (c) 2019 Lumerical Inc. """
 
+import numpy as np
+
 from lumopt.optimizers.optimizer import Optimizer
 
 class Minimizer(Optimizer):
     """ Base class (or super class) for all optimizers coded as minimizers. """
 
+    __slots__ = ()
+
     def define_callables(self, callable_fom, callable_jac):
         """ Defines the functions that the Optimizer class will use to evaluate the figure of merit and its gradient. The sign
             of the figure of merit and its gradient are flipped here so that the Optimizer class sees a maximizer rather
@@ -19,19 +23,21 @@ class Minimizer(Optimizer):
         """
 
         def callable_fom_local(params):
-            params_over_scaling_factor = params / self.scaling_factor
+            params_over_scaling_factor = params * self._inv_scaling
             fom = callable_fom(params_over_scaling_factor)
-            fom_penalty = self.penalty_fun(params_over_scaling_factor)
-            self.current_fom = -(fom + fom_penalty)
+            if self._has_penalty:
+                fom = fom + self.penalty_fun(params_over_scaling_factor)
+            self.current_fom = -fom
             self.current_params = params
             self.fom_calls += 1
             return self.current_fom * self.fom_scaling_factor
 
         def callable_jac_local(params):
-            params_over_scaling_factor = params / self.scaling_factor
-            fom_gradients = callable_jac(params_over_scaling_factor) / self.scaling_factor
-            fom_penalty_gradients = self.penalty_jac(params_over_scaling_factor) / self.scaling_factor
-            self.current_gradients = -(fom_gradients + fom_penalty_gradients)
+            params_over_scaling_factor = params * self._inv_scaling
+            fom_gradients = callable_jac(params_over_scaling_factor) * self._inv_scaling #< New array, so it can be updated in place below
+            if self._has_penalty:
+                fom_gradients += self.penalty_jac(params_over_scaling_factor) * self._inv_scaling
+            self.current_gradients = np.negative(fom_gradients, out = fom_gradients)
             if self.fom_calls==1:
                 self.callback(params)
             return self.current_gradients * self.fom_scaling_factor
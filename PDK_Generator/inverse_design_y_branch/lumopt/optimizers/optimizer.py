@@ -2,15 +2,20 @@
     Copyright (c) 2019 Lumerical Inc. """
 
 import os
-import copy
+import atexit
 import inspect
 import numpy as np
-import scipy as sp
-import scipy.misc
+
+from lumopt.utilities.history import OptimizationHistory
 
 class Optimizer(object):
     """ Base class (or super class) for all optimizers. """
 
+    ## Attributes accessed by the FOM and gradient callables on every call; concrete optimizers still get an instance dictionary
+    __slots__ = ('max_iter', 'scaling_factor', '_inv_scaling', 'scale_initial_gradient_to', 'penalty_fun', 'penalty_jac', '_has_penalty',
+                 'logging_path', 'logfile', '_log_fh', '_log_close_registered', 'current_fom', 'current_gradients', 'current_params', 'history', 'iteration',
+                 'fom_scaling_factor', 'fom_calls', 'bounds', '_bmin', '_bmax', 'start_point', 'callable_fom', 'callable_jac', 'callback')
+
     def __init__(self, max_iter, scaling_factor = 1.0, scale_initial_gradient_to = 0, penalty_fun = None, penalty_jac = None, logging_path = None):
         """ Most optimizers assume the variables to optimize are roughly of order of magnitude of one. Since geometry 
             parameters are usually of the order 1e-9 to 1e-6, it can be useful to scale them to have a magnitude close to one.
@@ -33,51 +38,69 @@ class Optimizer(object):
         self.max_iter = max_iter
         self.scaling_factor = np.array(scaling_factor).flatten()
         self.scale_initial_gradient_to = float(scale_initial_gradient_to)
+        self._has_penalty = penalty_fun is not None or penalty_jac is not None #< The default zero penalty is skipped by the callables
         self.penalty_fun = penalty_fun if penalty_fun is not None else lambda params: np.zeros(1)
         self.penalty_jac = penalty_jac if penalty_jac is not None else Optimizer.create_jac_approx(self.penalty_fun)
         self.logging_path = logging_path
 
         self.logfile = os.path.join(self.logging_path,'optimization_report.txt') if self.logging_path is not None else 'optimization_report.txt'
+        self._log_fh = None #< Log file handle, opened on the first report and kept open until the end of the run
+        self._log_close_registered = False #< The handle is also closed at interpreter exit, registered once per optimizer
 
-        if inspect.isfunction(self.penalty_fun):
-            bound_args = inspect.signature(self.penalty_fun).bind('params')
-            if bound_args.args != ('params',):
-                raise UserWarning("penalty function must take one positional argument.")
-        else:
+        if not callable(self.penalty_fun):
             raise UserWarning("penalty function must by a Python function.")
-        if inspect.isfunction(self.penalty_jac):
-            bound_args = inspect.signature(self.penalty_jac).bind('params')
-            if bound_args.args != ('params',):
-                raise UserWarning("penalty function gradient must take one positional argument.")
-        else:
+        if not Optimizer.takes_one_positional_argument(self.penalty_fun):
+            raise UserWarning("penalty function must take one positional argument.")
+        if not callable(self.penalty_jac):
             raise UserWarning("penalty function gradient must by a Python function.")
+        if not Optimizer.takes_one_positional_argument(self.penalty_jac):
+            raise UserWarning("penalty function gradient must take one positional argument.")
 
         self.current_fom = None
         self.current_gradients = []
         self.current_params = []
-        self.fom_hist = []
-        self.gradients_hist = []
-        self.params_hist = []
+        self.history = OptimizationHistory(max_iter)
         self.iteration = 0
         self.fom_scaling_factor=1
         self.fom_calls = 0
 
+    @staticmethod
+    def takes_one_positional_argument(fun):
+        """ Checks if the given callable can be called with a single positional argument. Plain Python functions are checked
+            through their code object; other callables (bound methods, functools.partial, ...) fall back to inspect.signature.
+        """
+        if inspect.isfunction(fun):
+            code = fun.__code__
+            num_required_args = code.co_argcount - len(fun.__defaults__ or ())
+            num_required_kwonly = code.co_kwonlyargcount - len(fun.__kwdefaults__ or {})
+            accepts_one_arg = code.co_argcount >= 1 or bool(code.co_flags & inspect.CO_VARARGS)
+            return accepts_one_arg and num_required_args <= 1 and num_required_kwonly == 0
+        try:
+            inspect.signature(fun).bind('params')
+        except (TypeError, ValueError):
+            return False
+        return True
+
     def initialize(self, start_params, callable_fom, callable_jac, bounds, plotting_function):
         """ Loads the scaled starting point, the bounds and the callables to be used in the optimizer."""
 
 #        assert bounds.shape[0] == start_params.size and bounds.shape[1] == 2
         assert self.scaling_factor.size == 1 or self.scaling_factor.size == start_params.size
+        self._inv_scaling = 1.0 / self.scaling_factor #< Used to unscale the parameters and gradients in every FOM and gradient call
         self.define_callback(plotting_function if plotting_function is not None else lambda params: None)
         self.callable_fom, self.callable_jac = self.define_callables(callable_fom, callable_jac)
         self.bounds = bounds
         if self.bounds is not None:
-            self.bounds = np.array(self.bounds)
+            self.bounds = np.array(self.bounds, dtype = float)
             if len(self.bounds.shape) < 2 or self.bounds.shape[0] != start_params.size or self.bounds.shape[1] != 2:
                 raise UserWarning("there must be two bounds for each optimization parameter.")
-            for bound in self.bounds:
-                if bound[1] - bound[0] <= 0.0:
-                    raise UserWarning("bound ranges must be positive.")
+            bad_bounds = np.flatnonzero(~(self.bounds[:,1] - self.bounds[:,0] > 0.0))
+            if bad_bounds.size > 0:
+                raise UserWarning("bound ranges must be positive (parameter indices {}).".format(bad_bounds.tolist()))
             self.bounds *= self.scaling_factor.reshape((self.scaling_factor.size, 1))
+        ## Views of the scaled lower and upper bounds, used for clamping the parameters
+        self._bmin = self.bounds[:,0] if self.bounds is not None else None
+        self._bmax = self.bounds[:,1] if self.bounds is not None else None
         self.reset_start_params(start_params, self.scale_initial_gradient_to)
 
     def reset_start_params(self, start_params, scale_initial_gradient_to):
@@ -95,44 +118,81 @@ class Optimizer(object):
         params = self.start_point
         gradients = self.callable_jac(params)
         params2 = (params - gradients)
-        bounds_min = np.array([bound[0] for bound in self.bounds])
-        bounds_max = np.array([bound[1] for bound in self.bounds])
-        clamped_params = np.maximum(bounds_min, (np.minimum(bounds_max, params2)))
+        clamped_params = np.clip(params2, self._bmin, self._bmax)
         actual_params = params - clamped_params
         max_change = max(abs(actual_params))
         self.fom_scaling_factor = min_required_rel_change / max_change
         print("Scaling factor is {}".format(self.fom_scaling_factor))
 
+    @property
+    def fom_hist(self):
+        return self.history.fom_view()
+
+    @property
+    def params_hist(self):
+        return self.history.params_view()
+
+    @property
+    def gradients_hist(self):
+        return self.history.grad_view()
+
     def define_callback(self, plotting_function):
         def callback(*args):
             """ Called at the end of each iteration to record results."""
-            self.params_hist.append(copy.copy(self.current_params))
-            self.fom_hist.append(self.current_fom)
-            if len(self.current_gradients) > 0:
-                self.gradients_hist.append(copy.copy(self.current_gradients))
-            plotting_function(args[0]/self.scaling_factor)
+            current_gradients = self.current_gradients if len(self.current_gradients) > 0 else None
+            self.history.append(self.current_fom, self.current_params, current_gradients) #< Copied into the history buffers
+            plotting_function(args[0]*self._inv_scaling)
             self.report_writing()
             self.iteration += 1
         self.callback = callback
 
+    def log_file(self):
+        """ Returns the handle of the log file, opening it if needed. Writes are buffered; the buffer is flushed when the
+            file is closed at the end of the run (or at interpreter exit).
+        """
+        if self._log_fh is None or self._log_fh.closed:
+            self._log_fh = open(self.logfile, 'a', buffering = 65536)
+            if not self._log_close_registered:
+                atexit.register(self.close_log_file)
+                self._log_close_registered = True
+        return self._log_fh
+
+    def close_log_file(self):
+        if getattr(self, '_log_fh', None) is not None:
+            self._log_fh.close()
+            self._log_fh = None
+
+    @staticmethod
+    def format_array(values):
+        """ Formats an array as a bracketed, comma separated list with a single printf-style formatting operation. """
+        values = np.ravel(values)
+        return '[' + ', '.join(['%.8g'] * values.size) % tuple(values) + ']'
+
     def report_writing(self):
-        with open(self.logfile,'a') as f:
-            f.write('AT ITERATION {}:  FOM = {}\n'.format(self.iteration, np.array2string(self.fom_hist[-1], separator = ', ', max_line_width = 10000)))
-            f.write('PARAMETERS = {}\n'.format(np.array2string(self.params_hist[-1]/self.scaling_factor, separator = ', ', max_line_width = 10000)))
-            f.write('\n \n')
+        f = self.log_file()
+        f.write('AT ITERATION {}:  FOM = {}\n'.format(self.iteration, Optimizer.format_array(self.fom_hist[-1])))
+        f.write('PARAMETERS = {}\n'.format(Optimizer.format_array(self.params_hist[-1]*self._inv_scaling)))
+        f.write('\n \n')
 
     def concurrent_adjoint_solves(self):
         return False
     
     @staticmethod
-    def create_jac_approx(fom_func):
+    def create_jac_approx(fom_func, dx = 1.0e-6):
+        """ Central finite difference approximation of the gradient of a function taking the optimization parameters and returning a single value. """
         def finite_diff_approx(opt_params):
-            jac = np.zeros_like(opt_params)
-            for index, param in np.ndenumerate(opt_params):
-                def single_param_fom_func(val):
-                    local_opt_params = np.array(opt_params)
-                    local_opt_params[index] = val
-                    return fom_func(local_opt_params)
-                jac[index] = sp.misc.derivative(func = single_param_fom_func, x0 = param, dx = 1.0e-6, n = 1, order = 3)
-            return jac
-        return finite_diff_approx
\ No newline at end of file
+            local_opt_params = np.array(opt_params, dtype = float)
+            flat_params = local_opt_params.reshape(-1) #< View, so each parameter is perturbed in place without copying the whole vector
+            fom_plus = np.empty(flat_params.size)
+            fom_minus = np.empty(flat_params.size)
+            for index in range(flat_params.size):
+                param = flat_params[index]
+                flat_params[index] = param + dx
+                fom_plus[index] = np.asarray(fom_func(local_opt_params)).item()
+                flat_params[index] = param - dx
+                fom_minus[index] = np.asarray(fom_func(local_opt_params)).item()
+                flat_params[index] = param
+            ## Only the calls to the user function are done in Python, the differences are taken in a single vectorized pass
+            jac = (fom_plus - fom_minus) / (2.0*dx)
+            return jac.reshape(local_opt_params.shape)
+        return finite_diff_approx
@@ -1,18 +1,41 @@
 """ Copyright (c) 2019 Lumerical Inc. """
 
-import copy
+from collections import OrderedDict
 import numpy as np
-import scipy as sp
 import scipy.optimize as spo
+try:
+    import numba
+except ImportError:
+    numba = None #< Optional, only used to compile user supplied penalty functions
 
 from lumopt.optimizers.minimizer import Minimizer
 
+class BoundedRandomDisplacement(object):
+    """ Default step-taking routine of the basin hopping optimizer: a uniform random displacement of the (scaled) parameters that
+        is clamped to the bounds, so that no hop is wasted on a point the local minimizer has to project back first. SciPy tunes the
+        stepsize attribute every 'interval' iterations to keep the acceptance rate of the hops close to 50%.
+    """
+
+    def __init__(self, stepsize, bounds = None, seed = None):
+        self.stepsize = float(stepsize)
+        self.bounds = bounds
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, x):
+        x += self.rng.uniform(-self.stepsize, self.stepsize, np.shape(x))
+        if self.bounds is not None:
+            np.clip(x, self.bounds[:,0], self.bounds[:,1], out = x)
+        return x
+
 class ScipyBasinHopping(Minimizer):
     """ 
         Wrapper for SciPy's basin hopping global optimizer. 
 
             https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.basinhopping.html#scipy.optimize.basinhopping
 
+        The hops are run one after the other: every figure of merit evaluation drives the same CAD session and writes simulation
+        files named after the current iteration, so local minimizations cannot be dispatched to a pool of worker processes.
+
         Parameters
         ----------
         :param niter:            The number of basin-hopping iterations.
@@ -22,7 +45,8 @@ class ScipyBasinHopping(Minimizer):
         :param stepsize:         Maximum step size for use in the random displacement.
         :param minimizer_kwargs: Extra keyword arguments to be passed to the local minimizer.
         :param take_step:        Callable take_step(x). Replaces the default step-taking routine with this routine. The default step-taking routine
-                                 is a random displacement of the coordinates, but other step-taking algorithms may be better for some systems.
+                                 is a random displacement of the coordinates clamped to the bounds (see BoundedRandomDisplacement), but other
+                                 step-taking algorithms may be better for some systems.
         :param accept_test:      Callable accept_test(f_new, x_new, f_old, x_old) returning a bool. It defines a test which will be used to judge
                                  whether or not to accept the step. This will be used in addition to the Metropolis test based on “temperature” T.
                                  If any of the tests return False then the step is rejected.
@@ -30,6 +54,11 @@ class ScipyBasinHopping(Minimizer):
         :param disp:             True to print status messages.
         :param niter_success:    Stop the run if the global minimum candidate remains the same for this number of iterations.
         :param seed:             If seed is not specified, then the np.RandomState singleton is used.
+        :param cache_size:       Number of figure of merit and gradient evaluations kept to avoid repeating simulations at revisited points.
+        :param hessp:            Callable hessp(params, vector) returning the product of the Hessian of the figure of merit with the vector, both
+                                 in terms of the unscaled optimization parameters. When given, the local minimizer switches from 'L-BFGS-B' to
+                                 'trust-constr' (which, unlike 'trust-ncg', honors the bounds); the curvature information usually saves the
+                                 line search evaluations of L-BFGS-B, each of which costs a simulation. The Hessian of the penalty is ignored.
         :param scaling_factor:   Used to scale the optimization parameters so that they have magnitudes in the range zero to one.
         :param scale_initial_gradient_to: enforces a rescaling of the gradient to change the optimization parameters by at least this much;
                                           the default value of zero disables automatic scaling.
@@ -39,6 +68,9 @@ class ScipyBasinHopping(Minimizer):
                                and returns a vector of the same length.
     """
 
+    ## Options of the local minimizer that are also understood by 'trust-constr'
+    TRUST_CONSTR_OPTIONS = ('maxiter', 'gtol', 'xtol', 'disp')
+
     def __init__(self,
                  niter = 100,
                  T = 1.0,
@@ -54,12 +86,14 @@ class ScipyBasinHopping(Minimizer):
                  scaling_factor = 1.0,
                  scale_initial_gradient_to = 0.0,
                  penalty_fun = None,
-                 penalty_jac = None):
+                 penalty_jac = None,
+                 cache_size = 256,
+                 hessp = None):
         super(ScipyBasinHopping, self).__init__(max_iter = niter,
                                                 scaling_factor = scaling_factor,
                                                 scale_initial_gradient_to = scale_initial_gradient_to,
-                                                penalty_fun = penalty_fun,
-                                                penalty_jac = penalty_jac)
+                                                penalty_fun = ScipyBasinHopping.jit_compile(penalty_fun),
+                                                penalty_jac = ScipyBasinHopping.jit_compile(penalty_jac))
         self.T = float(T)
         self.stepsize = float(stepsize)
         self.minimizer_kwargs = dict(minimizer_kwargs)
@@ -69,22 +103,142 @@ class ScipyBasinHopping(Minimizer):
         self.disp = bool(disp)
         self.niter_success = niter_success
         self.seed = int(seed)
+        self.cache_size = int(cache_size)
+        if hessp is not None and not callable(hessp):
+            raise UserWarning('hessp must be a callable taking the optimization parameters and a vector.')
+        self.hessp = hessp
+        self.callable_hessp = None
     
+    @staticmethod
+    def jit_compile(fun):
+        """ Compiles a user supplied penalty function (or its gradient) with numba when it is installed. The penalty is evaluated
+            in every iteration of the local minimizer; if numba cannot compile the function, the Python version is used instead.
+        """
+
+        if fun is None or numba is None or not callable(fun) or not Minimizer.takes_one_positional_argument(fun):
+            return fun #< Invalid functions are passed through so that the usual validation reports them
+        try:
+            compiled_funs = [numba.njit(cache = True)(fun)]
+        except Exception:
+            return fun
+
+        def jit_fun(params):
+            try:
+                return compiled_funs[0](params)
+            except Exception:
+                if compiled_funs[0] is fun:
+                    raise
+                compiled_funs[0] = fun #< Typing errors are only raised on the first call, permanently fall back to Python
+                return fun(params)
+        return jit_fun
+
+    def define_callables(self, callable_fom, callable_jac):
+        """ Wraps the callables of the minimizer in least recently used caches keyed by the parameter vector. Basin hopping and
+            the local minimizer regularly request the figure of merit or its gradient at a point that was already evaluated (e.g.
+            when a hop is rejected), and every evaluation otherwise requires a full simulation. The unscaled values are cached so
+            that the current FOM scaling factor is always applied.
+        """
+
+        callable_fom_local, callable_jac_local = super(ScipyBasinHopping, self).define_callables(callable_fom, callable_jac)
+        fom_cache = OrderedDict()
+        jac_cache = OrderedDict()
+
+        def cache_lookup(cache, params):
+            key = np.asarray(params, dtype = float).tobytes()
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return key, value
+
+        def cache_store(cache, key, value):
+            cache[key] = value
+            if len(cache) > self.cache_size:
+                cache.popitem(last = False)
+
+        def cached_fom(params):
+            key, current_fom = cache_lookup(fom_cache, params)
+            if current_fom is None:
+                scaled_fom = callable_fom_local(params)
+                cache_store(fom_cache, key, self.current_fom)
+                return scaled_fom
+            self.current_fom = current_fom
+            self.current_params = np.array(params, copy = True) #< SciPy may update its parameter array in place
+            self.fom_calls += 1
+            return self.current_fom * self.fom_scaling_factor
+
+        def cached_jac(params):
+            key, current_gradients = cache_lookup(jac_cache, params)
+            if current_gradients is None:
+                scaled_gradients = callable_jac_local(params)
+                cache_store(jac_cache, key, self.current_gradients)
+                return scaled_gradients
+            ## No callback on a hit: the plotting function records the last simulated point, not the cached one
+            self.current_gradients = current_gradients
+            return self.current_gradients * self.fom_scaling_factor
+
+        if self.hessp is not None:
+            def callable_hessp(params, vector):
+                hessian_product = self.hessp(params * self._inv_scaling, vector * self._inv_scaling) * self._inv_scaling
+                return -self.fom_scaling_factor * hessian_product #< Same sign flip and scaling as the gradient of the minimizer
+            self.callable_hessp = callable_hessp
+
+        return cached_fom, cached_jac
+
+    def define_hop_callbacks(self):
+        """ Wraps the callback of the optimizer so that the run stops as soon as the best figure of merit has not improved for
+            'niter_success' hops. SciPy only checks this condition after running the local minimization of the following hop,
+            which costs one full local minimization (many simulations) that cannot change the result. The best figure of merit
+            starts from the result of the initial local minimization of basinhopping, which the accept tests of the first hop
+            receive as the old figure of merit, so the first hop must improve on it like any other.
+        """
+
+        best_fom = [None]
+        hops_without_improvement = [0]
+
+        def accept_test(f_new, x_new, f_old, x_old):
+            if best_fom[0] is None:
+                best_fom[0] = f_old
+            if self.accept_test is None:
+                return True
+            return self.accept_test(f_new = f_new, x_new = x_new, f_old = f_old, x_old = x_old)
+
+        def hop_callback(x, f, accept):
+            self.callback(x)
+            if best_fom[0] is None or f < best_fom[0]:
+                best_fom[0] = f
+                hops_without_improvement[0] = 0
+            else:
+                hops_without_improvement[0] += 1
+            return self.niter_success is not None and hops_without_improvement[0] >= self.niter_success
+        return hop_callback, accept_test
+
     def run(self):
         print('Running SciPy basin hopping global optimizer:')
         print('bounds = {}'.format(self.bounds))
         print('start = {}'.format(self.start_point))
         self.minimizer_kwargs['bounds'] = self.bounds
         self.minimizer_kwargs['jac'] = self.callable_jac
+        if self.callable_hessp is not None:
+            self.minimizer_kwargs['method'] = 'trust-constr'
+            self.minimizer_kwargs['hessp'] = self.callable_hessp
+            self.minimizer_kwargs['hess'] = None
+            ## Only the options shared with 'trust-constr' are kept, the L-BFGS-B specific ones (ftol, maxcor, maxls, eps, ...) are unknown to it
+            options = self.minimizer_kwargs.get('options') or {}
+            self.minimizer_kwargs['options'] = {key: value for key, value in options.items() if key in ScipyBasinHopping.TRUST_CONSTR_OPTIONS}
+        ## Fault in the local minimizer on a trivial problem so that its one-time setup is not paid on top of the first simulation
+        if self.minimizer_kwargs.get('method') == 'L-BFGS-B':
+            spo.minimize(lambda x: float(np.dot(x, x)), np.zeros(2), jac = lambda x: 2.0*x, method = 'L-BFGS-B', bounds = [(-1.0, 1.0)]*2, options = {'maxiter': 1})
+        take_step = self.take_step if self.take_step is not None else BoundedRandomDisplacement(self.stepsize, self.bounds, self.seed)
+        hop_callback, accept_test = self.define_hop_callbacks()
         res = spo.basinhopping(func = self.callable_fom,
                                x0 = self.start_point,
                                niter = self.max_iter,
                                T = self.T,
                                stepsize = self.stepsize,
                                minimizer_kwargs = self.minimizer_kwargs,
-                               take_step = self.take_step,
-                               accept_test = self.accept_test,
-                               callback = self.callback,
+                               take_step = take_step,
+                               accept_test = accept_test,
+                               callback = hop_callback,
                                interval = self.interval,
                                disp = self.disp,
                                niter_success = self.niter_success,
@@ -103,19 +257,21 @@ class ScipyBasinHopping(Minimizer):
         print('Number of FOM evaluations: {}'.format(res.nfev))
         print('BEST FOM = {}'.format(best_res.fun))
         print('BEST PARAMETERS = {}'.format(best_res.x))
-        with open(self.logfile,'a') as f:
-            f.write('best_fom = {};\n'.format(best_res.fun))
-            f.write('best_params = {};\n'.format(best_res.x))
-            if hasattr(best_res, 'jac'):
-                f.write('best_jac = {};\n'.format(best_res.jac))
-            f.write('\n \n')
+        f = self.log_file()
+        f.write('best_fom = {};\n'.format(best_res.fun))
+        f.write('best_params = {};\n'.format(ScipyBasinHopping.format_array(best_res.x)))
+        if hasattr(best_res, 'jac'):
+            f.write('best_jac = {};\n'.format(ScipyBasinHopping.format_array(best_res.jac)))
+        f.write('\n \n')
+        f.flush()
         return res
 
     def report_writing(self):
-        with open(self.logfile,'a') as f:
-            f.write('\n')
-            f.write('fom(1+{0}) = {1};\n'.format(self.iteration, np.array2string(self.fom_hist[-1], separator = ', ')))
-            f.write('params(1+{0},:) = {1};\n'.format(self.iteration, np.array2string(self.params_hist[-1]/self.scaling_factor, separator = ', ')))
-            if len(self.gradients_hist) > 0:
-                f.write('jac(1+{0},:) = {1};\n'.format(self.iteration, np.array2string(-self.gradients_hist[-1]*self.scaling_factor, separator = ', ')))
-            f.write('\n')
\ No newline at end of file
+        ## Written through the buffered log handle of the optimizer; the buffer is flushed at the end of the run
+        f = self.log_file()
+        f.write('\n')
+        f.write('fom(1+{0}) = {1:.8g};\n'.format(self.iteration, float(self.fom_hist[-1])))
+        f.write('params(1+{0},:) = {1};\n'.format(self.iteration, ScipyBasinHopping.format_array(self.params_hist[-1]*self._inv_scaling)))
+        if len(self.gradients_hist) > 0:
+            f.write('jac(1+{0},:) = {1};\n'.format(self.iteration, ScipyBasinHopping.format_array(-self.gradients_hist[-1]*self.scaling_factor)))
+        f.write('\n')
@@ -4,8 +4,6 @@
 import numpy as np
 import scipy as sp
 from lumopt.utilities.scipy_wrappers import wrapped_GridInterpolator
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 
 class Fields(object):
     """ 
@@ -98,6 +96,7 @@ class Fields(object):
         return field_interpolator
 
     def plot(self,ax,title,cmap):
+        import matplotlib.pyplot as plt #< Deferred so that matplotlib is only loaded when plotting
         ax.clear()
         xx, yy = np.meshgrid(self.x, self.y)
         z = (min(self.z) + max(self.z))/2 + 1e-10
@@ -124,6 +123,7 @@ class Fields(object):
             self.plot_field(self.getHfield, original_grid=original_grid, wl=wl, name='H')
 
     def plot_field(self,field_func=None,original_grid=True,wl=1550e-9,name='field'):
+        import matplotlib.pyplot as plt
         if field_func is None:
             field_func=self.getfield
         plt.ion()
@@ -221,6 +221,7 @@ class FieldsNoInterp(Fields):
         return field_interpolator
 
     def plot(self,ax,title,cmap):
+        import matplotlib.pyplot as plt
         ax.clear()
         xx, yy = np.meshgrid(self.x[1:-1], self.y[1:-1])
         z = (min(self.z) + max(self.z))/2 + 1e-10
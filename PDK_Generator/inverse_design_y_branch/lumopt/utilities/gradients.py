@@ -4,8 +4,6 @@
 import numpy as np
 import scipy as sp
 import scipy.constants
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 import lumapi
 
 class GradientFields(object):
@@ -42,6 +40,7 @@ class GradientFields(object):
         self.plot_gradients(fig, ax_gradients, original_grid)
 
     def plot_gradients(self, fig, ax_gradients, original_grid):
+        import matplotlib.pyplot as plt #< Deferred so that matplotlib is only loaded when plotting
         ax_gradients.clear()
 
         if original_grid:
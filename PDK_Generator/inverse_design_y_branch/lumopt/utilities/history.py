@@ -0,0 +1,50 @@
+import numpy as np
+
+class OptimizationHistory(object):
+    """ History of an optimization, stored as one contiguous buffer per quantity (figure of merit, parameters and gradients)
+        with one row per optimizer iteration. The buffers are allocated on first use with max_iter+1 rows and their capacity
+        is doubled whenever the optimizer runs past it (e.g. during the binarization phase).
+    """
+
+    def __init__(self, max_iter = 0):
+        self.capacity = int(max_iter) + 1
+        self.fom = None
+        self.params = None
+        self.grad = None
+        self.n = 0          #< Number of recorded figures of merit
+        self.n_params = 0   #< Parameters and gradients are only recorded by optimizations that keep track of them
+        self.n_grad = 0
+
+    def append(self, fom, params = None, grad = None):
+        self.fom = self._write_row(self.fom, self.n, fom)
+        self.n += 1
+        if params is not None:
+            self.params = self._write_row(self.params, self.n_params, params)
+            self.n_params += 1
+        if grad is not None:
+            self.grad = self._write_row(self.grad, self.n_grad, grad)
+            self.n_grad += 1
+
+    def _write_row(self, buffer, row, value):
+        value = np.asarray(value)
+        if buffer is None:
+            buffer = np.empty((max(self.capacity, row + 1),) + value.shape, dtype = np.result_type(value.dtype, np.float64))
+        elif row >= buffer.shape[0]:
+            grown_buffer = np.empty((max(2*buffer.shape[0], row + 1),) + buffer.shape[1:], dtype = buffer.dtype)
+            grown_buffer[:buffer.shape[0]] = buffer
+            buffer = grown_buffer
+        buffer[row] = value
+        return buffer
+
+    @staticmethod
+    def _view(buffer, num_rows):
+        return buffer[:num_rows] if buffer is not None else np.empty(0)
+
+    def fom_view(self):
+        return self._view(self.fom, self.n)
+
+    def params_view(self):
+        return self._view(self.params, self.n_params)
+
+    def grad_view(self):
+        return self._view(self.grad, self.n_grad)
@@ -1,6 +1,7 @@
 """ Copyright chriskeraly
     Copyright (c) 2019 Lumerical Inc. """
 
+import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.animation
@@ -47,6 +48,8 @@ class Plotter(object):
             self.fig, self.ax = plt.subplots(nrows=2, ncols=2, figsize=(12, 10))
 
         self.fig.show()
+        self.layout_done = False
+        self.last_saved_fom = None
         self.movie = movie
         if movie:
             metadata = dict(title = 'Optimization', artist='lumopt', comment = 'Continuous adjoint optimization')
@@ -72,12 +75,26 @@ class Plotter(object):
             if not optimization.geometry.plot(self.ax[1,0]):
                 optimization.gradient_fields.plot_eps(self.ax[1,0])
                 
-    def draw_and_save(self):
-        plt.tight_layout()
-        self.fig.canvas.draw()
+    def fom_changed(self, fom, rtol = 1.0e-6):
+        ''' Checks if the figure of merit changed (relative to its magnitude) since the last saved frame. '''
+        if fom is None or self.last_saved_fom is None:
+            return True
+        fom = np.asarray(fom)
+        return fom.shape != self.last_saved_fom.shape or bool(np.any(np.abs(fom - self.last_saved_fom) > rtol*np.abs(fom)))
+
+    def draw_and_save(self, fom = None):
+        ''' Refreshes the figure and, when recording a movie, saves it as a new frame. Frames are only saved when the figure of merit
+            passed in changed since the last saved frame, which avoids encoding identical looking images on plateaus.
+        '''
+        ## The axes and their labels are the same in every iteration, so the layout only has to be solved for the first frame
+        if not self.layout_done:
+            plt.tight_layout()
+            self.layout_done = True
+        self.fig.canvas.draw_idle()
         self.fig.canvas.flush_events()
-        if self.movie:
+        if self.movie and self.fom_changed(fom):
             self.writer.grab_frame()
+            self.last_saved_fom = np.array(fom) if fom is not None else None
             print('Saved frame')
 
     def set_legend(self, legend):
@@ -22,7 +22,8 @@ class Simulation(object):
 
     def save(self, name):
         """ Saves simulation file. """
-        self.fdtd.cd(self.workingDir)
+        ## The CAD is moved to the working directory once in the constructor and the file name is absolute,
+        ## so there is no need to change directory again on every save
         full_name = os.path.join(self.workingDir, name)
         self.fdtd.save(full_name)
         return full_name
@@ -37,11 +38,13 @@ class Simulation(object):
             ----------
             :param filename:    filename of the VTK file to store the index data
         """
-        if self.fdtd.getnamednumber("global_index") > 0:
-            script=('idx = getresult("global_index", "index");'
-                    'vtksave("{}.vtr", idx);'
-                    'clear(idx);').format(filename)
-            self.fdtd.eval(script)
+        ## The check is done by the script itself, so that the whole export takes a single call to the CAD
+        script=('if(getnamednumber("global_index") > 0) {{'
+                '    idx = getresult("global_index", "index");'
+                '    vtksave("{}.vtr", idx);'
+                '    clear(idx);'
+                '}}').format(filename)
+        self.fdtd.eval(script)
 
     def remove_data_and_save(self):
         self.fdtd.switchtolayout()
@@ -1,31 +1,72 @@
 #Parser function for YAML + Export function for GDS
 
-try:
-    import yaml
-except:
-    import pip
-    pip.main(['install', 'yaml'])
-    import yaml
-
-try:
-    import pandas as pd
-except:
-    import pip
-    pip.main(['install', 'pandas'])
-    import pandas as pd
-    
-try:
-    import pya
-except:
-    import pip
-    pip.main(['install', 'klayout'])
-    import pya
+import sys
+import os
+import importlib
+import subprocess
+import numpy as np
+
+#Module name and PyPI distribution of each third party package (the YAML parser is distributed as 'pyyaml', not 'yaml')
+_REQUIREMENTS = (('yaml', 'pyyaml'), ('pya', 'klayout'))
+
+def _require(mod, pkg = None):
+    """
+    Imports a module, raising an ImportError that tells how to install it when it is missing
+
+    Parameters
+    ----------
+    mod : str
+        Name the module is imported by
+    pkg : str, optional
+        Name of the distribution on PyPI, when it differs from the module name
+
+    Returns
+    -------
+    module
+        The imported module
+
+    """
+    try:
+        return importlib.import_module(mod)
+    except ImportError as e:
+        raise ImportError("'{}' is required: install it with '{} -m pip install {}', or run 'python parsers.py' "
+                          "to install all missing packages".format(mod, sys.executable, pkg or mod)) from e
+
+def install_requirements():
+    """
+    Installs the missing third party packages with pip
+
+    Returns
+    -------
+    None.
+
+    """
+    for mod, pkg in _REQUIREMENTS:
+        try:
+            importlib.import_module(mod)
+        except ImportError:
+            subprocess.check_call([sys.executable, '-m', 'pip', 'install', pkg])
+    importlib.invalidate_caches()
+
+#Running this file installs the missing packages; importing it never does
+if __name__ == '__main__':
+    install_requirements()
+
+yaml = _require('yaml', 'pyyaml')
+pya = _require('pya', 'klayout')
+
+#Set up path to the common modules. PDK_Generator needs to be in sys.path
+proj_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if proj_path not in sys.path:
+    sys.path.append(proj_path)
+
+from common.common_methods import YAMLLoader
 
 class parse:
     
     def extract_YAML(self,datafile):
         """
-        Function that parses YAML file and stores into a panda dataframe
+        Function that parses YAML file into a dictionary of its sections
 
         Parameters
         ----------
@@ -34,21 +75,19 @@ class parse:
 
         Returns
         -------
-        panda dataframe
-            Dataframe that organizes information on the Design Intent YAML
+        dict
+            Dictionary mapping each section of the Design Intent YAML 
+            (component, layers_used, optimization_variables, ...) to its list of entries
 
         """
         with open (datafile, 'r') as yaml_datafile: 
-            #Load as python object 
-            yaml_datafile = yaml.load(yaml_datafile, Loader=yaml.FullLoader)
-            #Organize by layers
-            self.df = pd.json_normalize(yaml_datafile)
-            self.df.to_csv('test.csv')
-            return self.df
+            #Load as python object (C parser when PyYAML was built with libyaml)
+            self.data = yaml.load(yaml_datafile, Loader=YAMLLoader)
+            return self.data
         
         
 class exports():
-    def export_klayout(points, layer = [1,0]):
+    def export_klayout(points, layer = [1,0], out_file = 'y_branch_3D.gds'):
         # this method creates a OAS layout file for a given PCell using klayout pya library
         ly = pya.Layout()
         # create pcell
@@ -56,15 +95,17 @@ class exports():
         # define layer
         l1 = ly.layer(layer[0], layer[1])
         
-        shape = []
-        for x in points:
-            shape.append(x)
-
-        pts = [pya.DPoint(i[0]/0.0000001,i[1]/0.0000001) for i in shape]
-        poly = pya.DPolygon(pts); poly.new(pts)  
+        #Scale all coordinates in one vectorized operation
+        coords = np.asarray(points, dtype = float)[:, :2] * 1e7
+        pts = [pya.DPoint(x, y) for x, y in coords.tolist()]
+        poly = pya.DPolygon(pts)
 
         top.shapes(l1).insert(poly)
-        ly.write('y_branch_3D.gds')
+        #Write as OASIS when requested, which is far more compact for the many-vertex shapes of inverse design
+        opts = pya.SaveLayoutOptions()
+        opts.format = 'OASIS' if out_file.lower().endswith('.oas') else 'GDS2'
+        opts.write_context_info = False
+        ly.write(out_file, opts)
 
         return ly
     
@@ -18,29 +18,23 @@ def parameter_checks():
     
     with open (datafile, 'r') as yaml_datafile: 
             #Load as python object 
-            yaml_datafile = yaml.load(yaml_datafile, Loader=yaml.FullLoader)
-            #Organize by layers
-            df = pd.json_normalize(yaml_datafile)
+            yaml_datafile = yaml.load(yaml_datafile, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
 
-    comp_df = df.iloc[0]['component']
-    comp_df = pd.DataFrame(comp_df)
+    comp_df = pd.DataFrame(yaml_datafile['component'])
     comp_df.to_csv('component.csv')
 
+    comp_df = comp_df.set_index('name')
+
     error_count = 0
 
-    #Check spans in each direction is greater than 0
-    for i in range(len(comp_df)):
-        if comp_df.loc[i,'x_span']<0:
-            print ("ERROR: Component x_span has a value of less than 0")
-            error_count+=1
-        if comp_df.loc[i,'y_span']<0:
-            print ("ERROR: Component y_span has a value of less than 0")
-            error_count+=1
-        if comp_df.loc[i,'z_span']<0:
-            print ("ERROR: Component z_span has a value of less than 0")
-            error_count+=1
+    #Check spans in each direction is greater than 0 (one vectorized comparison over all components)
+    spans = ['x_span', 'y_span', 'z_span']
+    negative_spans = comp_df[spans].to_numpy() < 0
+    error_count += int(negative_spans.sum())
+    for col, span in enumerate(spans):
+        if negative_spans[:, col].any():
+            print ("ERROR: Component " + span + " has a value of less than 0 (" + ", ".join(map(str, comp_df.index[negative_spans[:, col]])) + ")")
         
-    comp_df = comp_df.set_index('name')
     #check that components need to be mirrored at the y-axis
 
     x_coord_in = comp_df.loc['input_wg','x']
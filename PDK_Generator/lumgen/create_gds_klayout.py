@@ -62,8 +62,9 @@ if libname not in libnames:
 
 
 # Create layout in specified technology
-ly = pya.Application.instance().main_window().create_layout(techname, 1).layout()
-cv = pya.Application.instance().main_window().current_view().active_cellview()
+main_window = pya.Application.instance().main_window()
+ly = main_window.create_layout(techname, 1).layout()
+cv = main_window.current_view().active_cellview()
 
 # Set up top cell
 topcell = ly.create_cell("TOP")
@@ -93,5 +94,9 @@ except:
     print("No chip_boundary PCell in {} library. Passing...".format(libname))
     pass
 
-# Write to output GDS
-ly.write(out_dir)
\ No newline at end of file
+# Write to output GDS (or OASIS, which is much more compact, when out_dir ends with .oas)
+# KLayout context info is only needed to reopen PCells as PCells, the file is only imported as static geometry
+save_opts = pya.SaveLayoutOptions()
+save_opts.format = "OASIS" if out_dir.lower().endswith(".oas") else "GDS2"
+save_opts.write_context_info = False
+ly.write(out_dir, save_opts)
\ No newline at end of file
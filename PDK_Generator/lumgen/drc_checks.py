@@ -1,8 +1,9 @@
-from common.common_methods import get_klayout_app_path, get_klayout_folder_path
+from common.common_methods import get_klayout_app_path, get_klayout_folder_path, get_klayout_executable,\
+    find_drc_file, count_drc_items
 from datetime import datetime
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import os
-import xml.etree.ElementTree as ET
 
 class DRCCheck():
     r"""Design Rule Check (DRC) class used to interface with KLayout's DRC engine
@@ -10,6 +11,20 @@ class DRCCheck():
     Performs technology specific DRC on specified GDS file(s) through KLayout's
     DRC engine. KLayout runs in command line in batch mode.
     
+    The tiling, thread count and deep mode are only passed to the DRC script,
+    as the runtime variables $tiles, $threads and $deep, when they are set.
+    The DRC decks have to read them, e.g. with "tiles($tiles.to_f) if $tiles"
+    and "threads($threads.to_i) if $threads"; they are ignored otherwise.
+    
+    Parameters
+    ----------
+    tiles_um : float, optional
+        Tile size (um) for tiled DRC. The default (None) does not pass a tile size.
+    threads : int, optional
+        Number of DRC threads. The default (None) does not pass a thread count.
+    deep : bool, optional
+        Whether hierarchical (deep) mode should be used. The default is False.
+    
     Attributes
     ----------
     klayout_folder_path : str
@@ -56,10 +71,34 @@ class DRCCheck():
     """
     
     
-    def __init__(self):
+    def __init__(self, tiles_um=None, threads=None, deep=False):
         self.klayout_folder_path = get_klayout_folder_path()
-        self.klayout_app_path = get_klayout_app_path()
+        # Commands are run without a shell, so the path must be the bare executable path
+        self.klayout_app_path = get_klayout_executable(get_klayout_app_path())
         self.drc_file_path = ""
+        self.tiles_um = tiles_um
+        self.threads = threads
+        self.deep = deep
+
+    def find_drc_file(self, techname):
+        """Find the DRC script (.lydrc) of a technology
+        
+        Searches the KLayout folder for the technology's DRC script the first
+        time it is needed; later calls (from any DRCCheck instance) are served
+        from a cache.
+
+        Parameters
+        ----------
+        techname : string
+            Name of technology
+
+        Returns
+        -------
+        string or None
+            Absolute path of the DRC script, None if it could not be found
+
+        """
+        return find_drc_file(self.klayout_folder_path, techname)
 
     def prompt_drc_check(self, num_errors):
         """Prompt user for input on whether to view layout with DRC results
@@ -123,10 +162,101 @@ class DRCCheck():
             Number of DRC Errors detected
 
         """
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
+        return count_drc_items(xml_file)
+    
+    def drc_command(self, gds_filepath, drc_results_filepath, threads=None):
+        """Build the command line that runs the DRC script in KLayout batch mode
+
+        Parameters
+        ----------
+        gds_filepath : string
+            File path of GDS file
+        drc_results_filepath : string
+            File path of the .lyrdb file the results are saved to
+        threads : int, optional
+            Number of DRC threads. The default is the threads of the DRCCheck.
+
+        Returns
+        -------
+        list of str
+            KLayout command and its arguments
+
+        """
+        command = [self.klayout_app_path, "-b", "-r",
+                   self.drc_file_path, "-rd",
+                   "in_gdsfile={}".format(gds_filepath), "-rd",
+                   "out_drc_results={}".format(drc_results_filepath)]
+        # Optional settings are left out rather than passed empty, since an empty string is true in Ruby
+        threads = threads or self.threads
+        if threads:
+            command += ["-rd", "threads={}".format(threads)]
+        if self.tiles_um:
+            command += ["-rd", "tiles={}".format(self.tiles_um)]
+        if self.deep:
+            command += ["-rd", "deep=true"]
+        return command
+
+    def run_drc_batch(self, techname, gds_filepaths, max_workers=None):
+        """Run tech specific DRC on several GDS files concurrently
         
-        return len(list(root.iter('item')))
+        Launches one KLayout batch process per GDS file, without prompting,
+        and saves the results of each file in the 'drc_results' folder next
+        to it. The DRC work happens in the KLayout processes, so the threads
+        only wait on them.
+
+        Parameters
+        ----------
+        techname : string
+            Name of technology
+        gds_filepaths : list of str
+            File paths of GDS files
+        max_workers : int, optional
+            Number of KLayout processes running at the same time. The default
+            is the number of CPUs divided by the threads of each DRC run, or
+            one process per GDS file (up to the number of CPUs) if the threads
+            are not set.
+
+        Returns
+        -------
+        dict
+            Number of DRC errors of each GDS file path, None if the DRC
+            could not be run on the file
+
+        """
+        self.drc_file_path = self.find_drc_file(techname)
+        if not self.drc_file_path or not self.klayout_app_path:
+            print("Could not find DRC file..." if not self.drc_file_path else "Could not find KLayout application...")
+            return {gds_filepath: None for gds_filepath in gds_filepaths}
+        cpu_count = os.cpu_count() or 1
+        if not max_workers:
+            if self.threads:
+                max_workers = max(1, cpu_count // self.threads)
+            else:
+                max_workers = max(1, min(len(gds_filepaths), cpu_count))
+        timestamp = datetime.now().strftime("%Y-%m-%d-%H%M-")
+        
+        def run_one(gds_filepath):
+            if not os.path.exists(gds_filepath):
+                print("GDS file path {} does not exist... No DRC run...".format(gds_filepath))
+                return None
+            drc_results_dir = os.path.join(os.path.dirname(gds_filepath), 'drc_results')
+            os.makedirs(drc_results_dir, exist_ok=True)
+            component_name = os.path.splitext(os.path.basename(gds_filepath))[0]
+            drc_results_filepath = os.path.join(drc_results_dir, timestamp+component_name+"_drc_results.lyrdb")
+            # Output is captured so that concurrent runs do not interleave, and shown if the run fails
+            process = subprocess.Popen(self.drc_command(gds_filepath, drc_results_filepath),
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            output = process.communicate()[0]
+            if process.returncode != 0 or not os.path.exists(drc_results_filepath):
+                print("DRC on {} failed (exit code {})...\n{}".format(gds_filepath, process.returncode, output))
+                return None
+            return self.get_total_drc_errors(drc_results_filepath)
+        
+        print("Running DRC on {} GDS files ({} at a time)...".format(len(gds_filepaths), max_workers))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = dict(zip(gds_filepaths, executor.map(run_one, gds_filepaths)))
+        print("DRC Complete\n")
+        return results
     
     def run_drc(self, techname, gds_filepath, component_name):
         """Run tech specific DRC on given GDS file
@@ -153,6 +283,9 @@ class DRCCheck():
         if not os.path.exists(gds_filepath):
             print("GDS file path {} does not exist... No DRC run...".format(gds_filepath))
             return False
+        if not self.klayout_app_path:
+            print("Could not find KLayout application... No DRC run...")
+            return False
         
         # Create folder to save DRC results
         self.drc_results_dir = os.path.join(os.path.dirname(gds_filepath), 'drc_results')
@@ -160,32 +293,21 @@ class DRCCheck():
             os.mkdir(self.drc_results_dir)
         
         print("Finding {}_DRC.lydrc file...".format(techname))
-        # Get path to DRC file if not available
-        if not self.drc_file_path:
-            for root, dirs, files in os.walk(self.klayout_folder_path):
-                for file in files:
-                    if file.endswith(".lydrc") and "{}_DRC".format(techname) in file:
-                        print("KLAYOUT DRC FILE PATH:")
-                        print(os.path.join(root, file) + "\n")
-                        self.drc_file_path = os.path.join(root, file)
-        else:
+        # Get path to DRC file (searched once per technology)
+        self.drc_file_path = self.find_drc_file(techname)
+        if self.drc_file_path:
             print("KLAYOUT DRC FILE PATH:")
             print(self.drc_file_path + "\n")
         
         if self.drc_file_path:
             # Run DRC and save results
             print("Running KLayout in command line...")
-            print("NOTE: If you copy and paste the following commands into cmd line, ensure quotations are around file paths so that spaces are captured\n")
             print("Running DRC on {}... Saving to {}...".format(os.path.split(gds_filepath)[-1], "{}_drc_results.lyrdb".format(component_name)))
             now = datetime.now()
             out_file_name = now.strftime("%Y-%m-%d-%H%M-")+component_name+"_drc_results.lyrdb"
-            command = ["{}".format(self.klayout_app_path), "-b", "-r",
-                       "{}".format(self.drc_file_path), "-rd", 
-                       "in_gdsfile={}".format(gds_filepath), "-rd",
-                       "out_drc_results={}".format(os.path.join(self.drc_results_dir, out_file_name))]
-            for cmd in command:
-                print(cmd, end=" ")
-            subprocess.run(command, shell=True)
+            command = self.drc_command(gds_filepath, os.path.join(self.drc_results_dir, out_file_name))
+            print(subprocess.list2cmdline(command))
+            subprocess.run(command)
             print("\nDRC Complete\n")
             
             drc_results_filepath = os.path.join(self.drc_results_dir, out_file_name)
@@ -195,12 +317,11 @@ class DRCCheck():
             if continue_result:
                 # Open GDS file along with DRC results
                 print("Opening GDS and DRC results...")
-                command = ["{}".format(self.klayout_app_path),
-                           "{}".format(gds_filepath), "-m",
-                           "{}".format(os.path.join(os.path.dirname(gds_filepath), drc_results_filepath))]
-                for cmd in command:
-                    print(cmd, end=" ")
-                subprocess.run(command, shell=True)
+                command = [self.klayout_app_path,
+                           gds_filepath, "-m",
+                           os.path.join(os.path.dirname(gds_filepath), drc_results_filepath)]
+                print(subprocess.list2cmdline(command))
+                subprocess.run(command)
                 print("\nOpened GDS and showing results\n")
             
             # Ask user whether to continue
@@ -8,16 +8,23 @@ Maps layers to component design file
 
 # Set up path to modules. PDK-Generator/python needs to be in sys.path
 import sys, os
-proj_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+import pathlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+_HERE = os.path.dirname(os.path.realpath(__file__))
+proj_path = os.path.dirname(_HERE)
 if proj_path not in sys.path:
     sys.path.append(proj_path)
     
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QMessageBox,\
 QDialog, QGridLayout, QLabel, QComboBox, QGroupBox, QVBoxLayout, QDialogButtonBox, QFileDialog
 from PyQt5.QtGui import QFont
+from common.common_methods import new_dialog_button_box, connect_signal, combo_box_text,\
+    YAMLLoader, YAMLDumper, etree as ET, load_yaml_cached
 
 import yaml
-import xml.etree.ElementTree as ET
+
+log = logging.getLogger(__name__)
 
 
 class LayerMappingDialog(QDialog):
@@ -103,22 +110,19 @@ class LayerMappingDialog(QDialog):
         
         # Create labels associated to drop down menus
         self.component_combo_dict = {}
-        for i in range(0, len(component_layer_names)):
-            self.component_layer = QLabel(component_layer_names[i], self)
+        for i, component_layer_name in enumerate(component_layer_names):
+            self.component_layer = QLabel(component_layer_name, self)
             layout.addWidget(self.component_layer, i+1, 0)
-            # Create drop down menu
-            self.component_combo_dict[component_layer_names[i]] = QComboBox()
-            ind = 0
-            for layer_name, source in process_layer_sources.items():
-                self.component_combo_dict[component_layer_names[i]].addItem("{} - {}".format(layer_name, source))
-                if self.layer_mapping.get(component_layer_names[i],'').split(' - ')[0] == layer_name:
-                    self.component_combo_dict[component_layer_names[i]].setCurrentIndex(ind)
-                ind += 1
-            try:
-                self.component_combo_dict[component_layer_names[i]].activated(self.update_component_to_process_layer_mapping)
-            except:
-                self.component_combo_dict[component_layer_names[i]].activated.connect(self.update_component_to_process_layer_mapping)
-            layout.addWidget(self.component_combo_dict[component_layer_names[i]], i+1, 1)
+            # Create drop down menu, preselecting the process layer of the saved mapping
+            combo_box = QComboBox()
+            self.component_combo_dict[component_layer_name] = combo_box
+            preselect = self._preselect.get(component_layer_name, '')
+            for ind, (layer_name, source) in enumerate(process_layer_sources.items()):
+                combo_box.addItem("{} - {}".format(layer_name, source))
+                if preselect == layer_name:
+                    combo_box.setCurrentIndex(ind)
+            connect_signal(combo_box.activated, self.update_component_to_process_layer_mapping)
+            layout.addWidget(combo_box, i+1, 1)
             
         # Create group box around labels and drop down menus
         self.groupBox.setLayout(layout)
@@ -126,14 +130,9 @@ class LayerMappingDialog(QDialog):
         vbox.addWidget(self.groupBox)
         
         # Create OK and Cancel buttons
-        try:
-            self.button = QDialogButtonBox().new_buttons(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-            self.button.accepted(self.ok_clicked)
-            self.button.rejected(self.cancel_clicked)
-        except:
-            self.button = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-            self.button.accepted.connect(self.ok_clicked)
-            self.button.rejected.connect(self.cancel_clicked)
+        self.button = new_dialog_button_box(QDialogButtonBox, QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        connect_signal(self.button.accepted, self.ok_clicked)
+        connect_signal(self.button.rejected, self.cancel_clicked)
                
         vbox.addWidget(self.button)
         self.setLayout(vbox)
@@ -147,13 +146,9 @@ class LayerMappingDialog(QDialog):
 
         """
         for component_layer, combo_box in self.component_combo_dict.items():
-            if type(combo_box.currentText) != str:
-                process_layer = combo_box.currentText()
-            else:
-                process_layer = str(combo_box.currentText)
-            print("{}: {}".format(component_layer, process_layer))
+            process_layer = combo_box_text(combo_box)
+            log.debug("%s: %s", component_layer, process_layer)
             self.layer_mapping[component_layer] = process_layer
-        print("")
         
     def ok_clicked(self):
         """Function handler for when user selects 'Ok'
@@ -168,12 +163,9 @@ class LayerMappingDialog(QDialog):
 
         """
         for component_layer, combo_box in self.component_combo_dict.items():
-            if type(combo_box.currentText) != str:
-                process_layer = combo_box.currentText()
-            else:
-                process_layer = str(combo_box.currentText)
-            print("{}: {}".format(component_layer, process_layer))
-            self.layer_mapping[component_layer] = process_layer
+            self.layer_mapping[component_layer] = combo_box_text(combo_box)
+        # Print the final mapping in a single write
+        print("\n".join("{}: {}".format(component_layer, self.layer_mapping[component_layer]) for component_layer in self.component_combo_dict))
         self.save_layer_mapping()
         print("Closing window...\n")
         self.accept()
@@ -202,24 +194,24 @@ class LayerMappingDialog(QDialog):
         None.
 
         """
-        # Find layer_mapping.yml in current file directory or in destination
-        matches = []
-        for root, dirs, files in os.walk(os.path.dirname(os.path.realpath(__file__))):
-            for file in files:
-                if file == 'layer_mapping.yml':
-                    matches.append(os.path.join(root,file))
+        # Look for layer_mapping.yml where save_layer_mapping writes it: the
+        # current file directory, or the destination
+        candidates = [os.path.join(_HERE, 'layer_mapping.yml')]
         if self.destination:
-            for root, dirs, files in os.walk(self.destination):
-                for file in files:
-                    if file == 'layer_mapping.yml':
-                        matches.append(os.path.join(root,file))
-                        
+            candidates.append(os.path.join(self.destination, 'layer_mapping.yml'))
+        
         # If layer_mapping found, load it else set layer mapping to empty
-        if matches:
-            with open(matches[0], 'r') as f:
-                self.layer_mapping = yaml.load(f, Loader=yaml.FullLoader)
-        else:
-            self.layer_mapping = {}
+        self.layer_mapping = {}
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                with open(candidate, 'r') as f:
+                    self.layer_mapping = yaml.load(f, Loader=YAMLLoader) or {}
+                break
+        
+        # Process layer names of the saved mapping ("<layer name> - <source>"),
+        # used to preselect the drop down menus
+        self._preselect = {component_layer: process_layer.partition(' - ')[0]
+                           for component_layer, process_layer in self.layer_mapping.items()}
             
         print("Layer Mapping:")
         print(self.layer_mapping)
@@ -235,17 +227,52 @@ class LayerMappingDialog(QDialog):
 
         """
         try:
-            with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),'layer_mapping.yml'), 'w') as f:
-                yaml.dump(self.layer_mapping, f)
-            print("Saved layer mapping to {}".format(os.path.dirname(os.path.realpath(__file__))))
+            with open(os.path.join(_HERE,'layer_mapping.yml'), 'w') as f:
+                yaml.dump(self.layer_mapping, f, Dumper=YAMLDumper)
+            print("Saved layer mapping to {}".format(_HERE))
         except:
             if self.destination:
                 with open(os.path.join(self.destination,'layer_mapping.yml'), 'w') as f:
-                    yaml.dump(self.layer_mapping, f)
+                    yaml.dump(self.layer_mapping, f, Dumper=YAMLDumper)
                 print("Saved layer mapping to {}".format(self.destination))
             else:
                 print("Could not save layer mapping... Passing...")
                 
+def _collect_component_yamls(path, component_list):
+    """Get the parsed YAML files of the listed components
+    
+    Parameters
+    ----------
+    path : str
+        Absolute path to folder or file.
+    component_list: list
+        List of components to get YAML files for.
+
+    Returns
+    -------
+    list of tuple
+        (component name, file path, YAML data) of each component YAML file.
+
+    """
+    component_set = set(component_list)
+    component_yamls = []
+    
+    # If path is folder, get all component YAML files in it
+    if os.path.isdir(path):
+        for filepath in pathlib.Path(path).rglob('*.y*ml'):
+            name = filepath.name.split('.')[0]
+            if filepath.suffix in ('.yaml', '.yml') and name in component_set:
+                component_yamls.append((name, str(filepath), load_yaml_cached(str(filepath))))
+    elif os.path.isfile(path):
+        name = path.split("\\")[-1].split('/')[-1].split('.')[0]
+        if name in component_set:
+            component_yamls.append((name, path, load_yaml_cached(path)))
+    else:
+        print("File path does not exist... Passing...")
+    
+    return component_yamls
+
+
 def get_component_layer_names(path, component_list):
     """Get list of component layer names
     
@@ -267,83 +294,47 @@ def get_component_layer_names(path, component_list):
 
     """
     
-    component_layer_names = []
+    component_layer_names = {}
+    for name, filepath, data in _collect_component_yamls(path, component_list):
+        component_layer_names.update(dict.fromkeys(data.get('layers',{})))
     
-    # If path is folder, get all layer names in all component YAML files
-    if os.path.isdir(path):
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if (file.endswith(".yaml") or file.endswith(".yml")) and file.split('.')[0] in component_list:
-                    filepath = os.path.join(root, file)
-                    with open(filepath, 'r') as f:
-                        data = yaml.load(f, Loader=yaml.FullLoader)
-                        layers = list(data.get('layers',{}).keys())
-                        for layer in layers:
-                            if layer not in component_layer_names:
-                                component_layer_names.append(layer)
-    elif os.path.isfile(path):
-        if path.split("\\")[-1].split('/')[-1].split('.')[0] in component_list:
-            with open(path, 'r') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-                layers = list(data.get('layers',{}).keys())
-                for layer in layers:
-                    component_layer_names.append(layer)
-    else:
-        print("File path does not exist... Passing...")
-    
-    return component_layer_names
+    return list(component_layer_names)
 
 
 def get_process_layer_sources(process_lbr_path):
     tree = ET.parse(process_lbr_path)
-    all_layers = tree.findall('.//layer')
-    process_layer_sources = {}
-    for layer in all_layers:
-        process_layer_sources[layer.attrib['name']] = layer.attrib['layer_name']
-    return process_layer_sources
+    return {layer.attrib['name']: layer.attrib['layer_name'] for layer in tree.iter('layer')}
 
 def replace_layer_definitions(path, layer_mapping, component_list):
     
-    design_automation_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),'design_automation')
+    design_automation_dir = os.path.join(proj_path,'design_automation')
     
-    # If path is folder, find all YAML files and replace 'layer' fields with layer def
-    if os.path.isdir(path):
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if (file.endswith(".yaml") or file.endswith(".yml")) and file.split('.')[0] in component_list:
-                    name = file.split('.')[0]
-                    filepath = os.path.join(root, file)
-                    with open(filepath, 'r') as f:
-                        data = yaml.load(f, Loader=yaml.FullLoader)
-                        layers = list(data.get('layers',{}).keys())
-                        for layer in layers:
-                            if layer in layer_mapping:
-                                data['layers'][layer] = layer_mapping[layer]
-                    with open(os.path.join(design_automation_dir, name, name+"_design.yml"), 'w') as f:
-                        yaml.dump(data,f)
-                    
-    elif os.path.isfile(path):
-        name = path.split('\\')[-1].split('/')[-1].split('.')[0]
-        if name in component_list:
-            with open(path, 'r') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-                layers = list(data.get('layers',{}).keys())
-                for layer in layers:
-                    if layer in layer_mapping:
-                        data['layers'][layer] = layer_mapping[layer]
-            with open(os.path.join(design_automation_dir, name, name+"_design.yml"), 'w') as f:
-                yaml.dump(data,f)
-    else:
-        print("File path does not exist... Passing...")
+    # Replace 'layer' fields with layer def
+    def write_design_file(component_yaml):
+        name, filepath, data = component_yaml
+        if 'layers' in data:
+            data['layers'] = {layer: layer_mapping.get(layer, layer_def) for layer, layer_def in data['layers'].items()}
+        with open(os.path.join(design_automation_dir, name, name+"_design.yml"), 'w') as f:
+            yaml.dump(data, f, Dumper=YAMLDumper)
+    
+    # Design files are independent, so their writes are overlapped. Components
+    # sharing a name target the same design file, so only the last one found
+    # is kept, as when the files were written one after another
+    component_yamls = list({component_yaml[0]: component_yaml for component_yaml in _collect_component_yamls(path, component_list)}.values())
+    if component_yamls:
+        with ThreadPoolExecutor(max_workers=min(32, len(component_yamls), (os.cpu_count() or 1)*4)) as executor:
+            list(executor.map(write_design_file, component_yamls))
         
 def get_component_list(component_list_yaml):
     with open(component_list_yaml, 'r') as f:
-        data = yaml.load(f, Loader=yaml.FullLoader)
+        data = yaml.load(f, Loader=YAMLLoader)
         component_list = data.get('components-to-compile',[])
     return component_list
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # File locations
     process_lbr_path = os.path.join(os.path.dirname(proj_path),'yaml_processes','SiEPICfab-Grouse-Base.lbr')
     component_list_yaml = os.path.join(os.path.dirname(proj_path),'yaml_component_list','SiEPICfab-Grouse-Component-List.yaml')
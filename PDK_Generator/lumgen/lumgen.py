@@ -3,12 +3,19 @@ Lumerical Generation
 
 Prepares config files, runs design recipes, and compiles CML
 
+Components are run one at a time. With --workers N, N components run at the
+same time in separate processes; this is only meant for design recipes that
+need no input (no prompts, e.g. DRC prompts, and no windows), since worker
+processes cannot answer prompts and their output is interleaved. Each worker
+also needs its own Lumerical license.
+
 
 """
 
 # Set up path to modules. PDK-Generator/python needs to be in sys.path
 import sys, os
-proj_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+_HERE = os.path.dirname(os.path.realpath(__file__))
+proj_path = os.path.dirname(_HERE)
 if proj_path not in sys.path:
     sys.path.append(proj_path)
     
@@ -20,9 +27,17 @@ from techgen.laystack import LayerStack
 from techgen.tech import Technology
 from importlib import import_module
 from cml_compiler.cml_compiler_helper import CMLCompilerHelper
+from common.common_methods import new_dialog_button_box, connect_signal, combo_box_text,\
+    YAMLDumper, etree as ET, load_yaml_cached
 
 import yaml
-import xml.etree.ElementTree as ET
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import json
+import hashlib
+
+# Folders never holding component YAML files, skipped when walking the designs folder
+_SKIP_DIRS = {'__pycache__', '.git', '.idea', 'node_modules'}
 
 class LayerMappingDialog(QDialog):
     r"""A window for mapping Component layers and Process layers
@@ -30,7 +45,7 @@ class LayerMappingDialog(QDialog):
     Parameters
     ----------
     component_layer_names : list of str
-        List of component layer tags/names
+        List of component layer tags/names, shown in the given order
     process_layer_sources : dict
         Keys = Process layer name. Values = Process layer source
     destination : str, optional
@@ -83,7 +98,6 @@ class LayerMappingDialog(QDialog):
         self.read_layer_mapping()
         
         super(LayerMappingDialog, self).__init__()
-        component_layer_names.sort()
         
         self.setWindowTitle("Layer Mapping")
         self.resize(400, 120)
@@ -105,24 +119,23 @@ class LayerMappingDialog(QDialog):
         # Add default empty string as choice in drop down menu
         process_layer_sources[''] = ''
         
+        # Drop down menu entries are the same for every component layer, so they are formatted once
+        items = ["{} - {}".format(layer_name, source) for layer_name, source in process_layer_sources.items()]
+        item_index = {layer_name: ind for ind, layer_name in enumerate(process_layer_sources)}
+        
         # Create labels associated to drop down menus
         self.component_combo_dict = {}
-        for i in range(0, len(component_layer_names)):
-            self.component_layer = QLabel(component_layer_names[i], self)
+        for i, component_layer_name in enumerate(component_layer_names):
+            self.component_layer = QLabel(component_layer_name, self)
             layout.addWidget(self.component_layer, i+1, 0)
-            # Create drop down menu
-            self.component_combo_dict[component_layer_names[i]] = QComboBox()
-            ind = 0
-            for layer_name, source in process_layer_sources.items():
-                self.component_combo_dict[component_layer_names[i]].addItem("{} - {}".format(layer_name, source))
-                if self.layer_mapping.get(component_layer_names[i],'').split(' - ')[0] == layer_name:
-                    self.component_combo_dict[component_layer_names[i]].setCurrentIndex(ind)
-                ind += 1
-            try:
-                self.component_combo_dict[component_layer_names[i]].activated(self.update_component_to_process_layer_mapping)
-            except:
-                self.component_combo_dict[component_layer_names[i]].activated.connect(self.update_component_to_process_layer_mapping)
-            layout.addWidget(self.component_combo_dict[component_layer_names[i]], i+1, 1)
+            # Create drop down menu, preselecting the process layer of the saved mapping
+            combo_box = QComboBox()
+            self.component_combo_dict[component_layer_name] = combo_box
+            combo_box.addItems(items)
+            combo_box.setCurrentIndex(item_index.get(self.layer_mapping.get(component_layer_name,'').split(' - ')[0], 0))
+            # Only the entry of the changed combo box is updated on each selection
+            connect_signal(combo_box.activated, functools.partial(self._update_one, component_layer_name, combo_box))
+            layout.addWidget(combo_box, i+1, 1)
             
         # Create group box around labels and drop down menus
         self.groupBox.setLayout(layout)
@@ -130,18 +143,32 @@ class LayerMappingDialog(QDialog):
         vbox.addWidget(self.groupBox)
         
         # Create OK and Cancel buttons
-        try:
-            self.button = QDialogButtonBox().new_buttons(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-            self.button.accepted(self.ok_clicked)
-            self.button.rejected(self.cancel_clicked)
-        except:
-            self.button = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-            self.button.accepted.connect(self.ok_clicked)
-            self.button.rejected.connect(self.cancel_clicked)
+        self.button = new_dialog_button_box(QDialogButtonBox, QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        connect_signal(self.button.accepted, self.ok_clicked)
+        connect_signal(self.button.rejected, self.cancel_clicked)
                
         vbox.addWidget(self.button)
         self.setLayout(vbox)
         
+    def _update_one(self, component_layer, combo_box, index=None):
+        """Update the mapping of a single component layer tag
+        
+        Parameters
+        ----------
+        component_layer : str
+            Component layer tag/name.
+        combo_box : QComboBox
+            Drop down menu of the component layer.
+        index : int, optional
+            Selected index, passed by the activated signal. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.layer_mapping[component_layer] = combo_box_text(combo_box)
+        
     def update_component_to_process_layer_mapping(self):
         """Update component layer tag to Process layer mapping
         
@@ -151,13 +178,7 @@ class LayerMappingDialog(QDialog):
 
         """
         for component_layer, combo_box in self.component_combo_dict.items():
-            if type(combo_box.currentText) != str:
-                process_layer = combo_box.currentText()
-            else:
-                process_layer = str(combo_box.currentText)
-            print("{}: {}".format(component_layer, process_layer))
-            self.layer_mapping[component_layer] = process_layer
-        print("")
+            self.layer_mapping[component_layer] = combo_box_text(combo_box)
         
     def ok_clicked(self):
         """Function handler for when user selects 'Ok'
@@ -171,13 +192,9 @@ class LayerMappingDialog(QDialog):
         None.
 
         """
-        for component_layer, combo_box in self.component_combo_dict.items():
-            if type(combo_box.currentText) != str:
-                process_layer = combo_box.currentText()
-            else:
-                process_layer = str(combo_box.currentText)
-            print("{}: {}".format(component_layer, process_layer))
-            self.layer_mapping[component_layer] = process_layer
+        self.update_component_to_process_layer_mapping()
+        for component_layer in self.component_combo_dict:
+            print("{}: {}".format(component_layer, self.layer_mapping[component_layer]))
         self.save_layer_mapping()
         print("Closing window...\n")
         self.accept()
@@ -206,22 +223,16 @@ class LayerMappingDialog(QDialog):
         None.
 
         """
-        # Find layer_mapping.yml in current file directory or in destination
-        matches = []
-        for root, dirs, files in os.walk(os.path.dirname(os.path.realpath(__file__))):
-            for file in files:
-                if file == 'layer_mapping.yml':
-                    matches.append(os.path.join(root,file))
+        # Look for layer_mapping.yml where save_layer_mapping writes it: the
+        # current file directory, or the destination
+        candidates = [os.path.join(_HERE, 'layer_mapping.yml')]
         if self.destination:
-            for root, dirs, files in os.walk(self.destination):
-                for file in files:
-                    if file == 'layer_mapping.yml':
-                        matches.append(os.path.join(root,file))
+            candidates.append(os.path.join(self.destination, 'layer_mapping.yml'))
+        match = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
                         
-        # If layer_mapping found, load it else set layer mapping to empty
-        if matches:
-            with open(matches[0], 'r') as f:
-                self.layer_mapping = yaml.load(f, Loader=yaml.FullLoader)
+        # If layer_mapping found, load it else set layer mapping to empty (an empty file loads as None)
+        if match:
+            self.layer_mapping = load_yaml_cached(match) or {}
         else:
             self.layer_mapping = {}
             
@@ -239,13 +250,13 @@ class LayerMappingDialog(QDialog):
 
         """
         try:
-            with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),'layer_mapping.yml'), 'w') as f:
-                yaml.dump(self.layer_mapping, f)
-            print("Saved layer mapping to {}".format(os.path.dirname(os.path.realpath(__file__))))
+            with open(os.path.join(_HERE,'layer_mapping.yml'), 'w') as f:
+                yaml.dump(self.layer_mapping, f, Dumper=YAMLDumper)
+            print("Saved layer mapping to {}".format(_HERE))
         except:
             if self.destination:
                 with open(os.path.join(self.destination,'layer_mapping.yml'), 'w') as f:
-                    yaml.dump(self.layer_mapping, f)
+                    yaml.dump(self.layer_mapping, f, Dumper=YAMLDumper)
                 print("Saved layer mapping to {}".format(self.destination))
             else:
                 print("Could not save layer mapping... Passing...")
@@ -267,47 +278,43 @@ def get_component_layer_names(path, component_list):
     Returns
     -------
     component_layer_names : list of str
-        List of component layer names from component YAML files.
+        Sorted list of component layer names from component YAML files.
 
     """
     
-    component_layer_names = []
+    component_layer_names = set()
+    component_set = set(component_list)
     
     # If path is folder, get all layer names in all component YAML files
     if os.path.isdir(path):
         for root, dirs, files in os.walk(path):
+            # Prune in place so os.walk does not descend into hidden or cache folders
+            dirs[:] = [d for d in dirs if d not in _SKIP_DIRS and not d.startswith('.')]
             for file in files:
-                if (file.endswith(".yaml") or file.endswith(".yml")) and file.split('.')[0] in component_list:
+                if file.endswith((".yaml", ".yml")) and os.path.splitext(file)[0] in component_set:
                     filepath = os.path.join(root, file)
-                    with open(filepath, 'r') as f:
-                        data = yaml.load(f, Loader=yaml.FullLoader)
-                        layers = list(data.get('layers',{}).keys())
-                        for layer in layers:
-                            if layer not in component_layer_names:
-                                component_layer_names.append(layer)
+                    data = load_yaml_cached(filepath)
+                    component_layer_names.update(data.get('layers', {}))
     elif os.path.isfile(path):
-        if path.split("\\")[-1].split('/')[-1].split('.')[0] in component_list:
-            with open(path, 'r') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-                layers = list(data.get('layers',{}).keys())
-                for layer in layers:
-                    component_layer_names.append(layer)
+        if os.path.splitext(os.path.basename(path.replace("\\", "/")))[0] in component_set:
+            data = load_yaml_cached(path)
+            component_layer_names.update(data.get('layers', {}))
     else:
         print("File path does not exist... Passing...")
     
-    return component_layer_names
+    return sorted(component_layer_names)
 
 
 def get_process_layer_sources(process_path):
     
     process_layer_sources = {}
     if process_path.endswith(".lbr"):
-        tree = ET.parse(process_path)
-        all_layers = tree.findall('.//layer')
-        
-        for layer in all_layers:
-            process_layer_sources[layer.attrib['name']] = layer.attrib['layer_name']
-    elif process_path.endswith(".yaml") or process_path.endswith('.yml'):
+        # Stream the layer builder file, only the attributes of the layers are needed
+        for event, elem in ET.iterparse(process_path, events=('end',)):
+            if elem.tag == 'layer':
+                process_layer_sources[elem.attrib['name']] = elem.attrib['layer_name']
+                elem.clear()
+    elif process_path.endswith((".yaml", ".yml")):
         tech_LS = LayerStack(process_path)
 
         for layer_name, source in tech_LS.layer_sources.items():
@@ -316,81 +323,183 @@ def get_process_layer_sources(process_path):
         print("Unsupported file type... Returning...")
     return process_layer_sources
 
+# Records the inputs of each generated design file, see _write_design_file
+_DESIGN_CACHE_PATH = os.path.join(proj_path, '.cache', 'design_files.json')
+
+def _load_design_cache():
+    try:
+        with open(_DESIGN_CACHE_PATH, 'r') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _save_design_cache(cache):
+    # Drop the entries of design files that no longer exist (e.g. removed components)
+    cache = {path: entry for path, entry in cache.items() if os.path.isfile(path)}
+    os.makedirs(os.path.dirname(_DESIGN_CACHE_PATH), exist_ok=True)
+    with open(_DESIGN_CACHE_PATH, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+
+def _write_design_file(filepath, name, techname, libname, layer_mapping, design_automation_dir, cache):
+    """Write the design file of a component with the technology and layer mapping filled in
+    
+    The cache records the source file, the inputs and the resulting design
+    file of each component; when none of them changed since the last run the
+    design file is already up to date and is not regenerated. It is kept in a
+    single file, PDK_Generator/.cache/design_files.json.
+    
+    Parameters
+    ----------
+    filepath : str
+        Path to the component YAML file.
+    name : str
+        Component name.
+    techname : str
+        Technology name.
+    libname : str
+        Library the component belongs to.
+    layer_mapping : dict
+        Keys = component layer names/tags. Values = Process layer names.
+    design_automation_dir : str
+        Path to the design automation folder.
+    cache : dict
+        Keys = design file paths. Values = inputs of the design file, updated
+        in place.
+
+    Returns
+    -------
+    None.
+
+    """
+    design_dir = os.path.join(design_automation_dir, name)
+    design_filepath = os.path.join(design_dir, name+"_design.yml")
+    key = hashlib.blake2b(json.dumps({"src": os.path.realpath(filepath), "tech": techname, "lib": libname,
+                                      "map": layer_mapping}, sort_keys=True, default=str).encode()).hexdigest()
+    src_mtime = os.stat(filepath).st_mtime
+    try:
+        entry = cache[design_filepath]
+        if entry["key"] == key and entry["src_mtime"] == src_mtime and \
+                entry["design_mtime"] == os.stat(design_filepath).st_mtime:
+            return
+    except (OSError, KeyError, TypeError):
+        pass
+    
+    data = load_yaml_cached(filepath)
+    data['techname'] = techname
+    data['libname'] = libname
+    if 'CML' in data['design-params'].keys():
+        data['design-params']['CML'] = techname
+    data['layers'] = {layer: layer_mapping.get(layer, source) for layer, source in data.get('layers', {}).items()}
+    with open(design_filepath, 'w') as f:
+        yaml.dump(data, f, Dumper=YAMLDumper, default_flow_style=False)
+    cache[design_filepath] = {"key": key, "src_mtime": src_mtime, "design_mtime": os.stat(design_filepath).st_mtime}
+
 def replace_design_files(path, techname, layer_mapping, component_lib_list):
     
-    design_automation_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),'design_automation')
+    design_automation_dir = os.path.join(proj_path,'design_automation')
     
+    # Library of each component, so that every file needs a single lookup
+    # (a component listed in several libraries belongs to the first one)
+    name_to_lib = {}
+    for libname, component_list in component_lib_list.items():
+        for component in component_list:
+            name_to_lib.setdefault(component, libname)
+    
+    cache = _load_design_cache()
     # If path is folder, find all YAML files and replace 'layer' fields with layer def
     if os.path.isdir(path):
         for root, dirs, files in os.walk(path):
+            # Prune in place so os.walk does not descend into hidden or cache folders
+            dirs[:] = [d for d in dirs if d not in _SKIP_DIRS and not d.startswith('.')]
             for file in files:
-                if (file.endswith(".yaml") or file.endswith(".yml")) and \
-                        any(file.split('.')[0] in list(component_list) for component_list in component_lib_list.values()):
-                    name = file.split('.')[0]
-                    for libname, component_list in component_lib_list.items():
-                        if name in component_list:
-                            libname = libname
-                            break
+                name = os.path.splitext(file)[0]
+                if file.endswith((".yaml", ".yml")) and name in name_to_lib:
                     filepath = os.path.join(root, file)
-                    with open(filepath, 'r') as f:
-                        data = yaml.load(f, Loader=yaml.FullLoader)
-                        data['techname'] = techname
-                        data['libname'] = libname
-                        if 'CML' in data['design-params'].keys():
-                            data['design-params']['CML'] = techname
-                        layers = list(data.get('layers',{}).keys())
-                        for layer in layers:
-                            if layer in layer_mapping:
-                                data['layers'][layer] = layer_mapping[layer]
-                    with open(os.path.join(design_automation_dir, name, name+"_design.yml"), 'w') as f:
-                        yaml.dump(data,f)
+                    _write_design_file(filepath, name, techname, name_to_lib[name], layer_mapping, design_automation_dir, cache)
                     
     elif os.path.isfile(path):
-        name = path.split('\\')[-1].split('/')[-1].split('.')[0]
-        for libname, component_list in component_lib_list.items():
-            if name in component_list:
-                libname = libname
-                break
-        if any(name in list(component_list) for component_list in component_lib_list.values()):
-            with open(path, 'r') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-                data['techname'] = techname
-                data['libname'] = libname
-                if 'CML' in data['design-params'].keys():
-                    data['design-params']['CML'] = techname
-                layers = list(data.get('layers',{}).keys())
-                for layer in layers:
-                    if layer in layer_mapping:
-                        data['layers'][layer] = layer_mapping[layer]
-            with open(os.path.join(design_automation_dir, name, name+"_design.yml"), 'w') as f:
-                yaml.dump(data,f)
+        name = os.path.splitext(os.path.basename(path.replace("\\", "/")))[0]
+        if name in name_to_lib:
+            _write_design_file(path, name, techname, name_to_lib[name], layer_mapping, design_automation_dir, cache)
     else:
         print("File path does not exist... Passing...")
+    _save_design_cache(cache)
  
 def get_component_list(component_list_yaml):
-    with open(component_list_yaml, 'r') as f:
-        data = yaml.load(f, Loader=yaml.FullLoader)
-        component_list = []
-        for sub_comp_list in data['components-to-compile'].values():
-            for comp in sub_comp_list:
-                component_list.append(comp)
+    data = load_yaml_cached(component_list_yaml)
+    component_list = []
+    for sub_comp_list in data['components-to-compile'].values():
+        for comp in sub_comp_list:
+            component_list.append(comp)
     return component_list
 
 def get_component_lib_list(component_list_yaml):
-    with open(component_list_yaml, 'r') as f:
-        data = yaml.load(f, Loader=yaml.FullLoader)
+    data = load_yaml_cached(component_list_yaml)
     return data['components-to-compile']
 
-def get_techname(process_path):
-    techname = ''
-    if process_path.endswith('.yml') or process_path.endswith('.yaml'):
+@functools.lru_cache(maxsize=8)
+def _techname_cached(process_path, mtime):
+    # Only the technology name is needed, read it from the cached YAML instead
+    # of building a full Technology object
+    try:
+        techname = (load_yaml_cached(process_path).get('technology') or {}).get('name') or ''
+    except yaml.YAMLError:
+        techname = ''
+    if not techname:
         T = Technology(process_path)
         techname = T.technology['technology']['name']
     return techname
 
+def get_techname(process_path):
+    techname = ''
+    if process_path.endswith((".yml", ".yaml")):
+        techname = _techname_cached(process_path, os.path.getmtime(process_path))
+    return techname
+
+def _run_component(component, process_lbr_path, hide, design_or_compile):
+    """Import the design automation module of a component and run it
+    
+    Parameters
+    ----------
+    component : str
+        Component name.
+    process_lbr_path : str
+        Path to the process file (.lbr).
+    hide : bool
+        Whether the simulation windows are hidden.
+    design_or_compile : str
+        '1' to run the design process, '2' to create compact models.
+
+    Returns
+    -------
+    dict, str or None
+        Compact models mapped to photonic models, path to a pre-generated
+        compact model, or None.
+
+    """
+    component_dir = os.path.join(proj_path, "design_automation", component)
+    if component_dir not in sys.path:
+        sys.path.append(component_dir)
+    
+    mod = import_module("design_automation.{name}.{name}_main".format(name=component))
+    compact_modelling = None
+    if design_or_compile == '2':
+        compact_modelling = mod.create_compact_model(process_lbr_path, hide)
+    elif design_or_compile == '1':
+        compact_modelling = mod.run_design_process(process_lbr_path, hide)
+    return compact_modelling
+
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    import argparse
+    parser = argparse.ArgumentParser(description="Prepares config files, runs design recipes, and compiles CML")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of components run at the same time in separate processes (default 1). "
+                             "Only for non-interactive design recipes: workers cannot answer prompts or show windows, "
+                             "and each needs its own Lumerical license.")
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # File locations
     process_yaml_path = QFileDialog().getOpenFileName(caption='Generate Lumerical Designs: Select Process YAML', options=QFileDialog.DontUseNativeDialog)
@@ -428,26 +537,25 @@ if __name__ == "__main__":
         hide = False
     else:
         hide = True
+    num_workers = max(1, min(args.workers, len(component_list)))
     cml_model_mapping = {}
     cml_model_list = []
-    for component in component_list:
-        component_dir = os.path.join(proj_path, "design_automation", component)
-        if component_dir not in sys.path:
-            sys.path.append(component_dir)
-        
-        mod = import_module("design_automation.{name}.{name}_main".format(name=component))
-        if design_or_compile == '2':
-            compact_modelling = mod.create_compact_model(process_lbr_path, hide)
-        elif design_or_compile == '1':
-            compact_modelling = mod.run_design_process(process_lbr_path, hide)
-        
+    if num_workers > 1:
+        # Components are independent (own Lumerical session, own design_automation folder), so they run in worker processes.
+        # Workers cannot answer prompts, so this requires non-interactive design recipes (see --workers)
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_run_component, component, process_lbr_path, hide, design_or_compile) for component in component_list]
+            results = [future.result() for future in futures] #< Merged in component order, as when run one at a time
+    else:
+        results = (_run_component(component, process_lbr_path, hide, design_or_compile) for component in component_list)
+    for compact_modelling in results:
         # Handles compact models mapped to photonic models
         if type(compact_modelling) == dict:
             for cm_path, p_model in compact_modelling.items():
                 cml_model_mapping[cm_path] = p_model
         # Handles pre-generated compact model (.ice) files
         elif type(compact_modelling) == str:
-            cml_model_list.apppend(compact_modelling)
+            cml_model_list.append(compact_modelling)
  
     # Generate and update compact model files
     CCH = CMLCompilerHelper()
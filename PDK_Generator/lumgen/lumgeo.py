@@ -1,7 +1,8 @@
-from common.common_methods import get_klayout_app_path
+from common.common_methods import get_klayout_app_path, get_klayout_executable
 import klayout.db as db
 
 import os
+import json
 import subprocess
 
 def generate_lum_geometry(lum_app, process_file, gds_file):
@@ -42,31 +43,30 @@ def generate_lum_geometry(lum_app, process_file, gds_file):
 
 def generate_gds_from_pcell(gds_path, techname, libname, pcellname, params = {}):
     if not hasattr(generate_gds_from_pcell, "klayout_app_path"):
-        generate_gds_from_pcell.klayout_app_path = get_klayout_app_path()
+        # Commands are run without a shell, so the path must be the bare executable path
+        generate_gds_from_pcell.klayout_app_path = get_klayout_executable(get_klayout_app_path())
     if not hasattr(generate_gds_from_pcell, "create_gds_klayout_script"):
         generate_gds_from_pcell.create_gds_klayout_script = os.path.join(os.path.dirname(os.path.abspath(__file__)),"create_gds_klayout.py")
         
     klayout_app_path = generate_gds_from_pcell.klayout_app_path
     create_gds_klayout_script = generate_gds_from_pcell.create_gds_klayout_script
+    if not klayout_app_path:
+        print("Could not find KLayout application... No GDS generated for {}...\n".format(pcellname))
+        return gds_path
     
-    # Create params string
-    params_str = "params={"
-    for param, val in params.items():
-        params_str += "\""+param+"\": "+str(val)+"," 
-    params_str = params_str[:-1] + "}" # remove last comma
+    # Create params string (create_gds_klayout.py reads it back with json.loads)
+    params_str = "params=" + json.dumps(params)
     
-    command = ["{}".format(klayout_app_path),
-               "-r", "{}".format(create_gds_klayout_script), # Run script
+    command = [klayout_app_path,
+               "-r", create_gds_klayout_script, # Run script
                "-rd", "techname={}".format(techname), 
                "-rd", "libname={}".format(libname),
                "-rd", "pcellname={}".format(pcellname),
                "-rd", "out_dir={}".format(gds_path),
                "-rd", params_str]
-    cmd_str = ""
-    for cmd in command:
-        cmd_str = cmd_str + cmd + " "
-    subprocess.run(command, shell=True)
-    print(cmd_str + "\n")
+    # Run KLayout directly, without an intermediate shell
+    subprocess.run(command)
+    print(subprocess.list2cmdline(command) + "\n")
     
     return gds_path
 
@@ -79,7 +79,9 @@ def clear_all_gds(directory):
     None.
 
     '''
-    for file in os.listdir(directory):
-        if file.endswith('.gds'):
-            os.remove(file)
+    # Remove by full path, the bare file name would be resolved against the current working directory
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.gds') and entry.is_file():
+                os.remove(entry.path)
     print("Removed all GDS files in %s" % directory)
\ No newline at end of file
@@ -20,19 +20,32 @@ from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QMessageBox,\
 from PyQt5.QtGui import QFont
 import sys, os
 import numpy as np
+try:
+    # lxml (libxml2) parses faster and uses less memory than ElementTree
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 # XML to Dict parser, from:
 # https://stackoverflow.com/questions/2148119/how-to-convert-an-xml-string-to-a-dictionary-in-python/10077069
 def etree_to_dict(t):
-    from collections import defaultdict
     d = {t.tag: {} if t.attrib else None}
-    children = list(t)
+    # lxml returns comments and processing instructions as children, their tag is not a string
+    children = [child for child in t if isinstance(child.tag, str)]
     if children:
-        dd = defaultdict(list)
+        # Single children are stored directly, repeated tags are collected in a list
+        dd = {}
         for dc in map(etree_to_dict, children):
             for k, v in dc.items():
-                dd[k].append(v)
-        d = {t.tag: {k: v[0] if len(v) == 1 else v for k, v in dd.items()}}
+                if k in dd:
+                    cur = dd[k]
+                    if isinstance(cur, list):
+                        cur.append(v)
+                    else:
+                        dd[k] = [cur, v]
+                else:
+                    dd[k] = v
+        d = {t.tag: dd}
     if t.attrib:
         d[t.tag].update(('@' + k, v) for k, v in t.attrib.items())
     if t.text:
@@ -56,40 +69,57 @@ db.Path.get_points = get_points
 
 
 def xml_to_dict(t):
-    from xml.etree import cElementTree as ET
+    # Parse bytes when possible, lxml rejects str input with an encoding declaration
     try:
-        e = ET.XML(t)
+        e = ET.fromstring(t.encode() if isinstance(t, str) else t)
     except:
         raise UserWarning("Error in the XML file.")
     return etree_to_dict(e)
 
+# FDTD.xml path found for each (KLayout folder, technology), so the KLayout
+# folder is only walked once per session
+_FDTD_PATH_CACHE = {}
+
+def find_FDTD_settings_file(dir_path, techname):
+    key = (dir_path, techname)
+    # Search again if the cached file was removed; a missing file is cached as None
+    cached = _FDTD_PATH_CACHE.get(key, '')
+    if cached == '' or (cached is not None and not os.path.isfile(cached)):
+        import fnmatch
+        search_str = 'FDTD.xml'
+        _FDTD_PATH_CACHE[key] = None
+        for root, dirnames, filenames in os.walk(dir_path, followlinks=True):
+            # if tech_name in root:
+            if techname in root:
+                match = next(iter(fnmatch.filter(filenames, search_str)), None)
+                if match:
+                    # Only the first match is used, stop walking once it is found
+                    _FDTD_PATH_CACHE[key] = os.path.join(root, match)
+                    break
+    return _FDTD_PATH_CACHE[key]
+
 def load_FDTD_settings(process_yaml = ''):
 
-    import os
-    import fnmatch
     techname = get_techname(process_yaml)
     dir_path = get_klayout_folder_path()
-    search_str = 'FDTD.xml'
-    matches = []
-    for root, dirnames, filenames in os.walk(dir_path, followlinks=True):
-        for filename in fnmatch.filter(filenames, search_str):
-            # if tech_name in root:
-            if techname in root:
-                matches.append(os.path.join(root, filename))
+    f = find_FDTD_settings_file(dir_path, techname)
                 
-    if matches:
-        f = matches[0]
+    if f:
         print(f)
-        file = open(f, 'r')
-        FDTD = xml_to_dict(file.read())
-        file.close()
-
-        FDTD = FDTD['FDTD']
+        # Stream the settings, each <floats>/<strings> section is read once it is
+        # complete and then cleared, no full tree or intermediate dict is built
         FDTD1 = {}
-        for k in FDTD['floats'].keys():
-            FDTD1[k] = float(FDTD['floats'][k])
-        for k in FDTD['strings'].keys():
-            FDTD1[k] = FDTD['strings'][k]
+        try:
+            for event, section in ET.iterparse(f, events=('end',)):
+                if section.tag in ('floats', 'strings'):
+                    for child in section:
+                        if not isinstance(child.tag, str):
+                            continue #< Comments and processing instructions (lxml)
+                        text = child.text.strip() if child.text else None
+                        FDTD1[child.tag] = float(text) if section.tag == 'floats' else text
+                    section.clear()
+        except ET.ParseError:
+            raise UserWarning("Error in the XML file.")
         return FDTD1
     else:
         return None
@@ -233,6 +263,13 @@ class Net:
 # Define an Enumeration type for Python
 # TODO: maybe move to standard enum for python3
 # https://docs.python.org/3/library/enum.html
+# (mode name, mode number, mode index) of the selectable modes
+_MODE_MAP = (('fundamental TE mode', '1', 1), ('fundamental TM mode', '2', 2))
+
+def parse_mode_selection(mode_selection):
+    """Return the indexes of the modes named in the FDTD.xml mode selection"""
+    return [index for name, number, index in _MODE_MAP if name in mode_selection or number in mode_selection]
+
 def enum(*sequential, **named):
     enums = dict(zip(sequential, range(len(sequential))), **named)
     return type('Enum', (), enums)
@@ -267,15 +304,15 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     
     cell = ly_f.top_cell()
     
+    # The layout is flattened, so all shapes are in the top cell
     for layer in ly_f.layer_indexes():
-        
-        region = db.Region(cell.begin_shapes_rec(layer))
+        shapes = cell.shapes(layer)
+        if shapes.is_empty():
+            continue
+        region = db.Region(shapes)
         region.merge()
-        cell.layout().clear_layer(layer)
-        try:
-            cell.shapes(layer).insert(region)
-        except:
-            pass    
+        shapes.clear()
+        shapes.insert(region)
     
     
     # h = {}
@@ -418,12 +455,7 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     
     # Configure wavelength and polarization
     # polarization = {'quasi-TE', 'quasi-TM', 'quasi-TE and -TM'}
-    mode_selection = FDTD_settings['mode_selection']
-    mode_selection_index = []
-    if 'fundamental TE mode' in mode_selection or '1' in mode_selection:
-        mode_selection_index.append(1)
-    if 'fundamental TM mode' in mode_selection or '2' in mode_selection:
-        mode_selection_index.append(2)
+    mode_selection_index = parse_mode_selection(FDTD_settings['mode_selection'])
     if not mode_selection_index:
         error = QMessageBox()
         error.setStandardButtons(QMessageBox.Ok )
@@ -434,22 +466,6 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     # wavelength
     wavelength_start = FDTD_settings['wavelength_start']
     wavelength_stop =  FDTD_settings['wavelength_stop']
-    
-    # Configure wavelength and polarization
-    # polarization = {'quasi-TE', 'quasi-TM', 'quasi-TE and -TM'}
-    FDTDzspan=FDTD_settings['Initial_FDTD_Z_span']
-    mode_selection = FDTD_settings['mode_selection']
-    mode_selection_index = []
-    if 'fundamental TE mode' in mode_selection or '1' in mode_selection:
-        mode_selection_index.append(1)
-    if 'fundamental TM mode' in mode_selection or '2' in mode_selection:
-        mode_selection_index.append(2)
-    if not mode_selection_index:
-        error = db.QMessageBox()
-        error.setStandardButtons(db.QMessageBox.Ok )
-        error.setText("Error: Invalid modes requested.")
-        response = error.exec_()
-        return
   
     # Instantiate FDTD simulation object
     fdtd = lumapi.FDTD(hide = False)
@@ -490,24 +506,27 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     # configure boundary conditions to be PML where we have ports
     # FDTD_bc = {'y max bc': 'Metal', 'y min bc': 'Metal', 'x max bc': 'Metal', 'x min bc': 'Metal'}
     port_dict = {0.0: 'x max bc', 90.0: 'y max bc', 180.0: 'x min bc', -90.0: 'y min bc'}
+    # Scripts of all ports are sent to FDTD in a single eval
+    script_parts = []
     for p in pins:
         if p.rotation in [180.0, 0.0]:
-            fdtd.eval(" \
+            script_parts.append(" \
               addport; set('injection axis', 'x-axis'); set('x',%s); set('y',%s); set('y span',%s); set('z', %s); set('z span',%s); \
               " % (p.center.x*dbum, p.center.y*dbum,p.path.width*dbum,FDTDz,FDTDzspan)  )
         if p.rotation in [270.0, 90.0, -90.0]:
-            fdtd.eval(" \
+            script_parts.append(" \
               addport; set('injection axis', 'y-axis'); set('x',%s); set('y',%s); set('x span',%s); set('z', %s); set('z span',%s); \
               " % (p.center.x*dbum, p.center.y*dbum,p.path.width*dbum,FDTDz,FDTDzspan)  )
         if p.rotation in [0.0, 90.0]:
             p.direction = 'Backward'
         else:
             p.direction = 'Forward'
-        fdtd.eval(" \
+        script_parts.append(" \
           set('name','%s'); set('direction', '%s'); set('number of field profile samples', %s); updateportmodes(%s); \
           select('FDTD'); set('%s','PML'); \
           ?'Added pin: %s, set %s to PML'; " % (p.pin_name, p.direction, FDTD_settings['frequency_points_expansion'], mode_selection_index, \
               port_dict[p.rotation], p.pin_name, port_dict[p.rotation] )  )
+    fdtd.eval("\n".join(script_parts))
     
     # Calculate mode sources
     # Get field profiles, to find |E| = 1e-6 points to find spans
@@ -531,18 +550,15 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
                 else:
                   Efield_xyz = np.array(E[:,0,:,0,:])
                 # find the field intensity (|Ex|^2 + |Ey|^2 + |Ez|^2)
-                Efield_intensity = np.empty([Efield_xyz.shape[0],Efield_xyz.shape[1]])
+                # (real**2 + imag**2 avoids building the complex magnitude array)
                 print(Efield_xyz.shape)
-                for a in range(0,Efield_xyz.shape[0]):
-                  for b in range(0,Efield_xyz.shape[1]):
-                    Efield_intensity[a,b] = abs(Efield_xyz[a,b,0])**2+abs(Efield_xyz[a,b,1])**2+abs(Efield_xyz[a,b,2])**2
+                Efield_xyz = Efield_xyz[:,:,:3]
+                Efield_intensity = np.sum(Efield_xyz.real**2 + Efield_xyz.imag**2, axis=2)
                 # find the max field for each z slice (b is the z axis)
-                Efield_intensity_b = np.empty([Efield_xyz.shape[1]])
-                for b in range(0,Efield_xyz.shape[1]):
-                  Efield_intensity_b[b] = max(Efield_intensity[:,b])
+                Efield_intensity_b = Efield_intensity.max(axis=0)
                 # find the z thickness where the field has sufficiently decayed
-                indexes = np.argwhere ( Efield_intensity_b > FDTD_settings['Efield_intensity_cutoff_eigenmode'] )
-                min_index, max_index = int(min(indexes)), int(max(indexes))
+                indexes = np.nonzero( Efield_intensity_b > FDTD_settings['Efield_intensity_cutoff_eigenmode'] )[0]
+                min_index, max_index = int(indexes.min()), int(indexes.max())
                 if min_z > z[min_index]:
                   min_z = z[min_index]
                 if max_z < z[max_index]:
@@ -580,30 +596,37 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
               set('source mode','mode %s');\
               run; " % ( in_pin.pin_name, m ) )
             port_pins = [in_pin]+out_pins if out_pins else pins
+            # Port expansions are fetched in a single eval
+            script_parts = []
             for p in port_pins:
                 if verbose:
                     print(' port %s expansion' % p.pin_name )
-                fdtd.eval( " \
+                script_parts.append( " \
                   P=Port_%s=getresult('FDTD::ports::%s','expansion for port monitor'); \
                    " % (p.pin_name,p.pin_name) )
-            fdtd.eval( "wavelengths=c/P.f*1e6;")
+            script_parts.append( "wavelengths=c/P.f*1e6;")
+            fdtd.eval("\n".join(script_parts))
             wavelengths = fdtd.getv( "wavelengths")
-            Sparams = []
+            # S-parameters (and their plots) are computed in a single eval, then
+            # each one is read back by name
+            script_parts = []
             for p in port_pins[1::]:
                 if verbose:
                     print(' S_%s_%s Sparam' % (p.pin_name,in_pin.pin_name) )
-                fdtd.eval( " \
+                script_parts.append( " \
                   Sparam=S_%s_%s= Port_%s.%s/Port_%s.%s;  \
                    " % (p.pin_name, in_pin.pin_name, \
                         p.pin_name, 'b' if p.direction=='Forward' else 'a', \
                         in_pin.pin_name, 'a' if in_pin.direction=='Forward' else 'b') )
-                Sparams.append(fdtd.getv( "Sparam"))
                 if plots:
                     if verbose:
                         print(' Plot S_%s_%s Sparam' % (p.pin_name,in_pin.pin_name) )
-                    fdtd.eval( " \
+                    script_parts.append( " \
                       plot (wavelengths, 10*log10(abs(Sparam(:,%s))^2),  'Wavelength (um)', 'Transmission (dB)', 'S_%s_%s, mode %s'); \
                        " % (modes.index(m)+1, p.pin_name, in_pin.pin_name, modes.index(m)+1) )
+            if script_parts:
+                fdtd.eval("\n".join(script_parts))
+            Sparams = [fdtd.getv( "S_%s_%s" % (p.pin_name, in_pin.pin_name)) for p in port_pins[1::]]
             Sparams_modes.append(Sparams)
         return Sparams, Sparams_modes
 
@@ -616,9 +639,11 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     # use the highest order mode for the convergence testing and reporting IL values.
     Sparam_pin_max_modes = []
     Mean_IL_best_port = [] # one for each mode
-    for m in mode_selection_index:
-        Sparam_pin_max_modes.append( np.amax(np.absolute(np.array(Sparams)[:,:,mode_selection_index.index(m)]), axis=1).argmax() + 1 )
-        Mean_IL_best_port.append( -10*np.log10(np.mean(np.absolute(Sparams)[Sparam_pin_max_modes[-1]-1,:,mode_selection_index.index(m)])**2) )
+    Sparams_abs = np.absolute(np.asarray(Sparams)) # [pin, wavelength, mode], computed once for all modes
+    for mi in range(len(mode_selection_index)):
+        pin_max = Sparams_abs[:,:,mi].max(axis=1).argmax()
+        Sparam_pin_max_modes.append( pin_max + 1 )
+        Mean_IL_best_port.append( -10*np.log10(np.mean(Sparams_abs[pin_max,:,mi])**2) )
 
     print("Sparam_pin_max_modes = %s" % Sparam_pin_max_modes)
 
@@ -627,8 +652,8 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     warning.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
     warning.setDefaultButton(QMessageBox.Yes)
     info_text = "First FDTD simulation complete (coarse mesh, lowest accuracy). Highest transmission S-Param: \n"
-    for m in mode_selection_index:
-        info_text +=  "mode %s, S_%s_%s has %s dB average insertion loss\n" % (m, pins[Sparam_pin_max_modes[mode_selection_index.index(m)]].pin_name, in_pin.pin_name, Mean_IL_best_port[mode_selection_index.index(m)])
+    for mi, m in enumerate(mode_selection_index):
+        info_text +=  "mode %s, S_%s_%s has %s dB average insertion loss\n" % (m, pins[Sparam_pin_max_modes[mi]].pin_name, in_pin.pin_name, Mean_IL_best_port[mi])
     warning.setInformativeText(info_text)
     warning.setText("Do you want to Proceed?")
     if verbose:
@@ -645,8 +670,11 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
     Sparam_pin_max = Sparam_pin_max_modes[-1]
     if FDTD_settings['convergence_tests']:
         test_converged = False
-        convergence = []
-        Sparams_abs_prev = np.array([np.absolute(Sparams)[Sparam_pin_max-1,:,:]])
+        # [z span, rms error] of each test, in a preallocated array that doubles
+        # when full; n_conv is the number of tests done
+        convergence = np.empty((16, 2))
+        n_conv = 0
+        Sparams_abs_prev = np.array([Sparams_abs[Sparam_pin_max-1,:,:]])
         while not test_converged:
             FDTDzspan += FDTD_settings['convergence_test_span_incremement']
             fdtd.eval( " \
@@ -655,20 +683,23 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
             Sparams, Sparams_modes = FDTD_run_Sparam_simple(pins, in_pin=in_pin, out_pins = [pins[Sparam_pin_max]], modes = mode_convergence, plots = True)
             Sparams_abs = np.array(np.absolute(Sparams))
             rms_error = np.sqrt(np.mean( (Sparams_abs_prev - Sparams_abs)**2 ))
-            convergence.append ( [FDTDzspan, rms_error] )
+            if n_conv == len(convergence):
+                convergence = np.vstack((convergence, np.empty_like(convergence)))
+            convergence[n_conv] = (FDTDzspan, rms_error)
+            n_conv += 1
             Sparams_abs_prev = Sparams_abs
             if verbose:
-                print (' convergence: span and rms error %s' % convergence[-1] )
+                print (' convergence: span and rms error %s' % convergence[n_conv-1] )
             fdtd.eval( " \
               ?'FDTD Z-span: %s, rms error from previous: %s (convergence testing until < %s)'; " % (FDTDzspan, rms_error, FDTD_settings['convergence_test_rms_error_limit']) )
             if rms_error < FDTD_settings['convergence_test_rms_error_limit']:
                 test_converged=True
                 FDTDzspan += -1*FDTD_settings['convergence_test_span_incremement']
             # check if the last 3 points have reducing rms
-            if len(convergence) > 2:
-                test_rms = np.polyfit(np.array(convergence)[-3:,0], np.array(convergence)[-3:,1], 1)
+            if n_conv > 2:
+                test_rms = np.polyfit(convergence[n_conv-3:n_conv,0], convergence[n_conv-3:n_conv,1], 1)
                 if verbose:
-                    print ('  convergence rms trend: %s; fit data: %s' %  (test_rms, np.array(convergence)[:,-3:]) )
+                    print ('  convergence rms trend: %s; fit data: %s' %  (test_rms, convergence[n_conv-3:n_conv]) )
                 if test_rms[0] > 0:
                     if verbose:
                         print (' convergence problem, not improving rms. terminating convergence test.'  )
@@ -676,7 +707,8 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
                     test_converged=True
                     FDTDzspan += -2*FDTD_settings['convergence_test_span_incremement']
         
-        fdtd.putv( 'convergence', convergence)
+        # Sent as nested lists, read as a cell array by the plotting script
+        fdtd.putv( 'convergence', convergence[:n_conv].tolist())
         fdtd.eval("\
                   sim_span = matrix(length(convergence),1); \
                   rms_error =  matrix(length(convergence),1);\
@@ -691,10 +723,9 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
       switchtolayout; select('FDTD'); set('mesh accuracy',%s);\
       set('z min bc','%s'); set('z max bc','%s'); \
       ?'FDTD mesh accuracy updated %s, Z boundary conditions: %s'; " % (FDTD_settings['mesh_accuracy'], FDTD_settings['Z-Boundary-Conditions'], FDTD_settings['Z-Boundary-Conditions'], FDTD_settings['mesh_accuracy'], FDTD_settings['Z-Boundary-Conditions']) )
-    for p in pins:
-        fdtd.eval( " \
+    fdtd.eval("\n".join([" \
         select('FDTD::ports::%s'); set('number of field profile samples', %s); \
-        ?'updated pin: %s'; " % (p.pin_name, FDTD_settings['frequency_points_expansion'], p.pin_name)  )
+        ?'updated pin: %s'; " % (p.pin_name, FDTD_settings['frequency_points_expansion'], p.pin_name) for p in pins]))
 
     # Run full S-parameters
     # add s-parameter sweep task
@@ -702,14 +733,16 @@ def generate_component_sparam(gds_path, process_file_lbr, process_file_yml, do_s
       deletesweep('s-parameter sweep'); \
       addsweep(3); NPorts=%s; \
       " % (len(pins))  )
+    script_parts = []
     for p in pins:
         for m in mode_selection_index:
             # add index entries to s-matrix mapping table
-            fdtd.eval( " \
+            script_parts.append( " \
               index1 = struct; \
               index1.Port = '%s'; index1.Mode = 'mode %s'; \
               addsweepparameter('s-parameter sweep',index1); \
             " % (p.pin_name, m))
+    fdtd.eval("\n".join(script_parts))
 
     # filenames for the s-parameter files
     files_sparam = []
@@ -0,0 +1,63 @@
+"""Tests for the helpers shared by the PDK_Generator tools."""
+
+import os
+import sys
+import xml.etree.ElementTree
+
+import pytest
+
+# Appended, so that the PDK_Generator package is not shadowed by PDK_Generator/PDK_Generator.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDK_Generator'))
+
+pytest.importorskip('yaml')
+from common import common_methods  # noqa: E402
+
+LYRDB = """<?xml version="1.0" encoding="utf-8"?>
+<report-database>
+ <categories><category><name>width</name></category></categories>
+ <items>
+  <item><category>width</category><values><value>box: (0,0;1,1)</value></values></item>
+  <!-- a comment between the markers -->
+  <item><category>width</category></item>
+  <item><category>space</category></item>
+ </items>
+</report-database>
+"""
+
+
+@pytest.fixture
+def lyrdb_file(tmp_path):
+    path = tmp_path / 'results.lyrdb'
+    path.write_text(LYRDB)
+    return str(path)
+
+
+def test_count_drc_items(lyrdb_file):
+    """Every item of the report is counted, whichever XML parser is installed."""
+    assert common_methods.count_drc_items(lyrdb_file) == 3
+
+
+def test_count_drc_items_without_lxml(lyrdb_file, monkeypatch):
+    """The ElementTree fallback streams the report to the same count."""
+    monkeypatch.setattr(common_methods, 'HAS_LXML', False)
+    monkeypatch.setattr(common_methods, 'etree', xml.etree.ElementTree)
+    assert common_methods.count_drc_items(lyrdb_file) == 3
+
+
+def test_count_drc_items_empty_report(tmp_path):
+    path = tmp_path / 'empty.lyrdb'
+    path.write_text('<report-database><items/></report-database>')
+    assert common_methods.count_drc_items(str(path)) == 0
+
+
+def test_load_yaml_cached(tmp_path):
+    """Callers get their own copy, and the file is parsed again once it changes."""
+    path = tmp_path / 'component.yml'
+    path.write_text('layers: {Waveguide: 1/0}\n')
+
+    data = common_methods.load_yaml_cached(str(path))
+    data['layers']['Waveguide'] = 'changed'
+    assert common_methods.load_yaml_cached(str(path)) == {'layers': {'Waveguide': '1/0'}}
+
+    path.write_text('layers: {Waveguide: 2/0, Text: 10/0}\n')
+    assert common_methods.load_yaml_cached(str(path)) == {'layers': {'Waveguide': '2/0', 'Text': '10/0'}}
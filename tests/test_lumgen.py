@@ -0,0 +1,75 @@
+"""Tests for the `lumgen` component generation scripts."""
+
+import os
+import sys
+
+import pytest
+
+_PDK_GENERATOR_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDK_Generator')
+# The lumgen scripts import each other as top level modules, as when run from their folder.
+# PDK_Generator is appended, so that the package is not shadowed by PDK_Generator/PDK_Generator.py
+sys.path.insert(0, os.path.join(_PDK_GENERATOR_DIR, 'lumgen'))
+sys.path.append(_PDK_GENERATOR_DIR)
+
+
+def test_clear_all_gds(tmp_path, monkeypatch):
+    """Only the GDS files of the given directory are removed, wherever the script runs from."""
+    pytest.importorskip('klayout.db')
+    from lumgeo import clear_all_gds
+
+    (tmp_path / 'a.gds').write_text('')
+    (tmp_path / 'b.gds').write_text('')
+    (tmp_path / 'a.fsp').write_text('')
+    (tmp_path / 'nested.gds').mkdir()
+    other_dir = tmp_path / 'other'
+    other_dir.mkdir()
+    (other_dir / 'a.gds').write_text('')
+    monkeypatch.chdir(other_dir)
+
+    clear_all_gds(str(tmp_path))
+
+    assert sorted(os.listdir(str(tmp_path))) == ['a.fsp', 'nested.gds', 'other']
+    assert os.listdir(str(other_dir)) == ['a.gds']
+
+
+@pytest.fixture(scope='module')
+def passivegen():
+    pytest.importorskip('klayout.db')
+    pytest.importorskip('PyQt5')
+    try:
+        import passivegen
+    except Exception as e:
+        # common.lumerical_lumapi fails with other errors than ImportError when Lumerical is not installed
+        pytest.skip("passivegen could not be imported: {}".format(e))
+    return passivegen
+
+
+def test_etree_to_dict(passivegen):
+    """Repeated tags become lists, attributes and text are kept, and XML comments are ignored."""
+    import xml.etree.ElementTree as ET
+
+    root = ET.fromstring('<settings version="2">'
+                         '<mode>TE</mode><mode>TM</mode>'
+                         '<mesh accuracy="3">fine</mesh>'
+                         '<empty/>'
+                         '</settings>')
+    assert passivegen.etree_to_dict(root) == {'settings': {'@version': '2',
+                                                           'mode': ['TE', 'TM'],
+                                                           'mesh': {'@accuracy': '3', '#text': 'fine'},
+                                                           'empty': None}}
+
+    lxml_etree = pytest.importorskip('lxml.etree')
+    root = lxml_etree.fromstring('<settings><!-- comment --><mode>TE</mode><?pi data?></settings>')
+    assert passivegen.etree_to_dict(root) == {'settings': {'mode': 'TE'}}
+
+
+@pytest.mark.parametrize('mode_selection, modes', [
+    ('fundamental TE mode', [1]),
+    ('fundamental TM mode', [2]),
+    ('fundamental TE mode and fundamental TM mode', [1, 2]),
+    ('1,2', [1, 2]),
+    ('2', [2]),
+    ('user select', []),
+])
+def test_parse_mode_selection(passivegen, mode_selection, modes):
+    assert passivegen.parse_mode_selection(mode_selection) == modes
@@ -0,0 +1,106 @@
+"""Tests for the vendored `lumopt` package of the Y-branch inverse design."""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'PDK_Generator', 'inverse_design_y_branch'))
+
+np = pytest.importorskip('numpy')
+
+
+def test_prepare_working_dir_picks_next_free_suffix(tmp_path, monkeypatch):
+    """A numbered working dir is continued from its suffix, skipping the existing ones."""
+    pytest.importorskip('lumapi')
+    from lumopt.optimization import Optimization
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'opt_3').mkdir()
+    (tmp_path / 'opt_4').mkdir()
+    (tmp_path / 'other_5').mkdir()
+    opt = SimpleNamespace(base_file_path=str(tmp_path), calling_file_name='')
+
+    Optimization.prepare_working_dir(opt, 'opt_3')
+    assert opt.workingDir == str(tmp_path / 'opt_5')
+    assert os.path.isdir(opt.workingDir)
+
+    Optimization.prepare_working_dir(opt, str(tmp_path / 'fresh'))
+    assert opt.workingDir == str(tmp_path / 'fresh_0')
+
+
+def test_optimization_history_grows_past_capacity():
+    """Rows past max_iter+1 double the buffers and keep the recorded values."""
+    from lumopt.utilities.history import OptimizationHistory
+
+    history = OptimizationHistory(max_iter=1)
+    for i in range(5):
+        history.append(float(i), np.array([i, -i]), np.array([2*i, 3*i]))
+
+    assert history.fom.shape[0] >= 5
+    np.testing.assert_array_equal(history.fom_view(), np.arange(5.0))
+    np.testing.assert_array_equal(history.params_view()[:, 0], np.arange(5.0))
+    np.testing.assert_array_equal(history.grad_view()[-1], [8.0, 12.0])
+
+
+def test_optimization_history_views():
+    """Views only cover the recorded rows, and are empty when nothing was recorded."""
+    from lumopt.utilities.history import OptimizationHistory
+
+    history = OptimizationHistory(max_iter=10)
+    assert history.fom_view().size == 0
+    assert history.params_view().size == 0
+
+    history.append(1.0)
+    history.append(2.0, np.array([0.5]))
+    assert history.fom_view().shape == (2,)
+    assert history.params_view().shape == (1, 1)
+    assert history.grad_view().size == 0
+    # A view shares the buffer instead of copying it
+    assert np.shares_memory(history.fom_view(), history.fom)
+
+
+def test_create_jac_approx_central_difference():
+    """The central differences match the analytic gradient and keep the parameter shape."""
+    from lumopt.optimizers.optimizer import Optimizer
+
+    fom = lambda params: float(np.sum(params**2) + params.reshape(-1)[0]*params.reshape(-1)[-1])
+    params = np.array([[1.0, -2.0], [0.5, 3.0]])
+    jac = Optimizer.create_jac_approx(fom, dx=1.0e-4)(params)
+
+    expected = 2.0*params
+    expected[0, 0] += params[1, 1]
+    expected[1, 1] += params[0, 0]
+    assert jac.shape == params.shape
+    np.testing.assert_allclose(jac, expected, rtol=1.0e-6)
+    # The caller's parameters are not perturbed in place
+    np.testing.assert_array_equal(params, [[1.0, -2.0], [0.5, 3.0]])
+
+
+def test_takes_one_positional_argument():
+    """Functions are checked through their code object, other callables through their signature."""
+    import functools
+    from lumopt.optimizers.optimizer import Optimizer
+
+    def two_args(a, b):
+        pass
+
+    def keyword_only(a, *, b):
+        pass
+
+    class Penalty(object):
+        def __call__(self, params):
+            pass
+
+    check = Optimizer.takes_one_positional_argument
+    assert check(lambda params: 0)
+    assert check(lambda params, weight=1.0: 0)
+    assert check(lambda *args: 0)
+    assert not check(lambda: 0)
+    assert not check(two_args)
+    assert not check(keyword_only)
+    assert check(functools.partial(two_args, b=1))
+    assert check(Penalty())
+    assert not check(Penalty)